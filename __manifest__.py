@@ -23,6 +23,7 @@
     # always loaded
     'data': [
         'security/ir.model.access.csv',
+        'data/ir_cron.xml',
         'wizard/hr_payslip_import_input.xml',
         'wizard/payrroll_excel_wizard.xml',
         'wizard/payment_report_excel.xml',
@@ -31,6 +32,8 @@
         'views/resource_calendar.xml',
         'views/hr_contract_views.xml',
         'views/hr_attenadnce_views.xml',
+        'views/hr_attendance_week_views.xml',
+        'views/hr_payslip_run_views.xml',
     ],
     'installable': True,
     'application': True,
@@ -1,4 +1,8 @@
 from . import hr_payslip
+from . import hr_payslip_run
 from . import resource_calendar
 from . import hr_contract
 from . import hr_attendance
+from . import hr_attendance_week
+from . import hr_work_entry_type
+from . import ir_attachment
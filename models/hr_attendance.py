@@ -1,6 +1,22 @@
+import logging
+from collections import defaultdict
+
+import numpy as np
+from psycopg2.extras import execute_values
+
 from odoo import api, fields, models
-from datetime import datetime, time, timedelta
-import pytz
+from odoo.tools import create_index, split_every, str2bool
+from datetime import date, datetime, time, timedelta
+
+from . import local_time
+from .resource_calendar import HE_BUCKETS
+
+_logger = logging.getLogger(__name__)
+
+HE_FIELDS = ('he25', 'he50', 'he75', 'sabado_acum')
+
+# Campos que cambian los acumulados semanales (hr.attendance.week)
+WEEK_TRACKED_FIELDS = frozenset(('employee_id', 'check_in', 'check_out'))
 
 
 class HRAttendance(models.Model):
@@ -17,6 +33,14 @@ class HRAttendance(models.Model):
                                store=True, readonly=True)
     dummy_total = fields.Float(string="Total HE", compute="_compute_he_total",
                                store=False)
+    he_recompute_pending = fields.Boolean(string="Recálculo HE pendiente", index=True,
+                                          copy=False, readonly=True)
+
+    def init(self):
+        super().init()
+        # Búsquedas por empleado y rango de entradas (importación, acumulados)
+        create_index(self.env.cr, 'hr_attendance_employee_id_check_in_index',
+                     self._table, ['employee_id', 'check_in'])
 
     def _safe_time_from_float(self, base_date, hour_float):
         """Convertir hora flotante a datetime de forma segura, manejando valores >= 24."""
@@ -36,267 +60,222 @@ class HRAttendance(models.Model):
         for rec in self:
             rec.dummy_total = rec.he25 + rec.he50 + rec.he75
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._mark_attendance_weeks()
+        return records
+
+    def write(self, vals):
+        tracked = not WEEK_TRACKED_FIELDS.isdisjoint(vals)
+        if tracked:
+            self._mark_attendance_weeks()
+        res = super().write(vals)
+        if tracked:
+            self._mark_attendance_weeks()
+        return res
+
+    def unlink(self):
+        self._mark_attendance_weeks()
+        return super().unlink()
+
+    def _mark_attendance_weeks(self):
+        """Marcar para recálculo los acumulados semanales de estas asistencias."""
+        keys = set()
+        for rec in self:
+            if rec.check_in:
+                day = local_time.to_local(rec.check_in, rec.employee_id.tz).date()
+                keys.add((rec.employee_id.id, day - timedelta(days=day.weekday())))
+        self.env['hr.attendance.week']._mark_pending(keys)
+
     @api.depends('check_in', 'check_out', 'employee_id')
     def _compute_he_franjas(self):
-        for rec in self:
-            rec.he25 = rec.he50 = rec.he75 = rec.sabado_acum = 0.0
+        """Calcula las franjas de horas extra de todo el recordset en una pasada.
+
+        Con el contexto ``he_trace`` o el parámetro ``kc_payroll_full.he_trace``
+        se registra en el log la traza de decisión de cada asistencia. Con el
+        contexto ``he_defer_compute`` (importaciones masivas) las franjas quedan
+        en cero y se calculan después con :meth:`_recompute_he`.
+        """
+        if self.env.context.get('he_defer_compute'):
+            zero = dict.fromkeys(HE_FIELDS, 0.0)
+            for rec in self:
+                rec.update(zero)
+            return
+        trace = self._he_trace_enabled()
+        for rec, values, decision in self._he_evaluate(trace=trace):
+            rec.update(values)
+            if decision is not None:
+                _logger.info("HE trace: %s", decision)
+
+    def _he_trace_enabled(self):
+        return bool(self.env.context.get('he_trace')) or str2bool(
+            self.env['ir.config_parameter'].sudo().get_param('kc_payroll_full.he_trace', 'False'))
+
+    def _he_evaluate(self, trace=False):
+        """Evaluar las horas extra del recordset sin escribirlas.
+
+        Contratos, calendarios y líneas de asistencia se leen una sola vez y los
+        registros se agrupan por (horas del contrato, calendario, nocturna).
+
+        :param trace: si es verdadero, construir la traza de decisión de cada registro.
+        :returns: generador de ``(registro, valores, traza)``; la traza es ``None``
+            si ``trace`` es falso.
+        """
+        zero = dict.fromkeys(HE_FIELDS, 0.0)
+        groups, line_days = self._he_prepare_batch()
+
+        # por _ids: en un onchange son NewId, y self.ids devolvería los registros
+        # de origen, que no deben recibir valores
+        pending = dict.fromkeys(self._ids)
+        for (full_req, calendar_id, nocturna), records in groups.items():
+            days = line_days[calendar_id]
+            calendar = self.env['resource.calendar'].browse(calendar_id)
+            table = calendar._get_overtime_band_table(full_req)
+            for rec in records:
+                pending.pop(rec._ids[0], None)
+                decision = None
+                if trace:
+                    decision = {
+                        'attendance': rec.id,
+                        'employee': rec.employee_id.id,
+                        'calendar': calendar_id,
+                        'full_req': full_req,
+                        'nocturna': nocturna,
+                        'source': 'calendario' if calendar._get_own_overtime_band_table()
+                        else 'predeterminado',
+                    }
+                if not table:
+                    if trace:
+                        decision['skip'] = 'sin franjas para el horario'
+                    yield rec, zero, decision
+                    continue
 
-            # Validar que tengamos check_in y check_out
-            if not (rec.check_in and rec.check_out):
-                continue
+                # Hora local en la zona horaria del empleado (no del usuario)
+                tz_name = rec.employee_id.tz or calendar.tz
+                local_check_in = local_time.to_local(rec.check_in, tz_name)
+                local_check_out = local_time.to_local(rec.check_out, tz_name)
+                weekday = local_check_in.weekday()
+                if trace:
+                    decision.update(tz=tz_name, check_in=local_check_in,
+                                    check_out=local_check_out, weekday=weekday)
+
+                # Las franjas marcadas "sin horario" (p.ej. sábado 60h diurno) no
+                # requieren líneas de calendario ese día
+                without_schedule, bands = table.get(weekday, (False, ()))
+                if str(weekday) not in days and not without_schedule:
+                    if trace:
+                        decision['skip'] = 'sin líneas de horario ese día'
+                    yield rec, zero, decision
+                    continue
 
-            # ——————————————————————————————
-            # 1) Obtener contrato y calendario
-            # ——————————————————————————————
+                detail = [] if trace else None
+                values = rec._he_compute_values(local_check_in, local_check_out, bands,
+                                                detail=detail)
+                if trace:
+                    decision.update(bands=detail, result=values)
+                yield rec, values, decision
+
+        for rec in self.browse(list(pending)):
+            decision = None
+            if trace:
+                decision = {'attendance': rec.id, 'employee': rec.employee_id.id,
+                            'skip': rec._he_skip_reason()}
+            yield rec, zero, decision
+
+    def _he_skip_reason(self):
+        """Motivo por el que la asistencia no entra en el cálculo (solo para trazas)."""
+        self.ensure_one()
+        if not (self.check_in and self.check_out):
+            return 'falta check_in o check_out'
+        if not self.employee_id.contract_id:
+            return 'sin contrato activo'
+        return 'sin calendario'
+
+    def _he_prepare_batch(self):
+        """Agrupa los registros con entrada y salida por (horas, calendario, nocturna).
+
+        :returns: tupla ``(groups, line_days)`` donde ``groups`` mapea la clave de
+            agrupación a la lista de registros y ``line_days`` mapea el id de cada
+            calendario al conjunto de ``dayofweek`` que tienen líneas.
+        """
+        records = self.filtered(lambda r: r.check_in and r.check_out)
+        employees = records.employee_id
+        contracts = employees.contract_id
+        calendars = contracts.resource_calendar_id | employees.resource_calendar_id
+        line_days = {
+            calendar.id: set(calendar.attendance_ids.mapped('dayofweek'))
+            for calendar in calendars
+        }
+
+        groups = defaultdict(list)
+        for rec in records:
             contract = rec.employee_id.contract_id
             if not contract:
                 continue
-
             calendar = contract.resource_calendar_id or rec.employee_id.resource_calendar_id
             if not calendar:
                 continue
-
-            # Día de la semana como string '0'..'6' (lunes=0, domingo=6)
-            dow = str(rec.check_in.weekday())
-
-            # Filtrar TODAS las líneas de asistencia de ese día
-            lines = calendar.attendance_ids.filtered(lambda l: l.dayofweek == dow).sorted(
-                'hour_from')
-
-            # EXCEPCIÓN: Para sábados en jornada 60h diurna, no requerir líneas de calendario
-            full_req = contract.full_time_required_hours or 0
-            nocturna = calendar.nocturna if hasattr(calendar, 'nocturna') else False
-            weekday = rec.check_in.weekday()
-
-            is_saturday_60h_day = (full_req == 60 and not nocturna and weekday == 5)
-
-            if not lines and not is_saturday_60h_day:
-                continue
-
-            # ——————————————————————————————
-            # 2) Construir horarios programados (todas las líneas)
-            # ——————————————————————————————
-            day = rec.check_in.date()
-
-            # IMPORTANTE: Trabajar en la misma timezone que check_in y check_out
-            # Si check_in tiene timezone, usar esa. Si no, asumir UTC y convertir a local
-            user_tz = pytz.timezone(self.env.user.tz or 'America/Tegucigalpa')
-
-            if rec.check_in.tzinfo:
-                local_check_in = rec.check_in.astimezone(user_tz).replace(tzinfo=None)
-                local_check_out = rec.check_out.astimezone(user_tz).replace(tzinfo=None)
-            else:
-                # Asumir que son UTC y convertir a local
-                check_in_utc = pytz.UTC.localize(rec.check_in)
-                check_out_utc = pytz.UTC.localize(rec.check_out)
-                local_check_in = check_in_utc.astimezone(user_tz).replace(tzinfo=None)
-                local_check_out = check_out_utc.astimezone(user_tz).replace(tzinfo=None)
-
-            day = local_check_in.date()
-
-            # Obtener configuraciones
-            full_req = contract.full_time_required_hours or 0
-            nocturna = calendar.nocturna if hasattr(calendar, 'nocturna') else False
-            actual_out = local_check_out  # Usar la versión local
-
-            # ——————————————————————————————
-            # 3) Caso: 60h/semana DIURNO
-            # ——————————————————————————————
-            if full_req == 60 and not nocturna:
-                # Obtener día de la semana (0=lunes, 5=sábado, 6=domingo)
-                weekday = local_check_in.weekday()
-
-                # DEBUG: Log para verificar
-                import logging
-                _logger = logging.getLogger(__name__)
-                _logger.info(
-                    f"DEBUG HE: Empleado {rec.employee_id.name}, fecha {local_check_in.date()}, weekday={weekday}, es_sabado={weekday == 5}")
-
-                # SÁBADO (weekday == 5): Todo el tiempo trabajado es HE25
-                if weekday == 5:  # Sábado
-                    # En sábado, toda la jornada es HE25
-                    total_hours = (actual_out - local_check_in).total_seconds() / 3600.0
-                    rec.he25 = max(0, total_hours)
-
-                # VIERNES (weekday == 4): Horario especial 06:00-18:00
-                elif weekday == 4:  # Viernes
-                    # Viernes: 06:00-14:00 ordinarias, 14:00-18:00 HE25
-                    ordinary_end = datetime.combine(day, time(14, 0))  # 14:00
-                    he25_end = datetime.combine(day, time(18, 0))  # 18:00
-
-                    # HE25: desde 14:00 hasta cuando salga (máximo 18:00 para esta franja)
-                    if actual_out > ordinary_end:
-                        he25_hours = (min(actual_out,
-                                          he25_end) - ordinary_end).total_seconds() / 3600.0
-                        rec.he25 = max(0, he25_hours)
-
-                    # Si trabaja después de las 18:00, aplicar franjas normales
-                    if actual_out > he25_end:
-                        # Desde 18:00 en adelante, usar lógica normal de HE
-                        w50_end = datetime.combine(day,
-                                                   time(23, 59, 59))  # he50: 18:00-00:00
-                        w75_start = datetime.combine(day + timedelta(days=1),
-                                                     time(0, 0))  # he75: 00:00-05:00
-                        w75_end = datetime.combine(day + timedelta(days=1), time(5, 0))
-
-                        # Agregar HE50: de 18:00 a 00:00
-                        if actual_out > he25_end:
-                            he50_hours = (min(actual_out,
-                                              w50_end) - he25_end).total_seconds() / 3600.0
-                            rec.he50 = max(0, he50_hours)
-
-                        # HE75: de 00:00 a 05:00
-                        if actual_out > w75_start:
-                            he75_hours = (min(actual_out,
-                                              w75_end) - w75_start).total_seconds() / 3600.0
-                            rec.he75 = max(0, he75_hours)
-
-                else:
-                    # DÍAS NORMALES (lunes-jueves): Lógica original
-                    # Para 60h diurno: las horas extra empiezan después de 8 horas trabajadas
-                    # O a las 15:00 (8h después de las 06:00), lo que sea más tarde
-
-                    # Tiempo cuando completó 8 horas desde check-in
-                    eight_hours_from_checkin = local_check_in + timedelta(hours=8)
-
-                    # Tiempo fijo: 15:00 (asumiendo jornada estándar desde 06:00)
-                    fixed_overtime_start = datetime.combine(day, time(15, 0))
-
-                    # Las HE empiezan cuando se complete el mayor de los dos
-                    overtime_start = max(eight_hours_from_checkin, fixed_overtime_start)
-
-                    # Si sale antes del inicio de overtime, no hay horas extra
-                    if actual_out <= overtime_start:
-                        continue
-
-                    # Ventanas de horas extra
-                    w25_end = datetime.combine(day, time(19,
-                                                         0))  # he25: desde overtime_start hasta 19:00
-                    w50_end = datetime.combine(day, time(23, 59, 59))  # he50: 19:00-00:00
-                    w75_start = datetime.combine(day + timedelta(days=1),
-                                                 time(0, 0))  # he75: 00:00-05:00
-                    w75_end = datetime.combine(day + timedelta(days=1), time(5, 0))
-
-                    # HE25: desde overtime_start hasta 19:00
-                    if actual_out > overtime_start:
-                        he25_hours = (min(actual_out,
-                                          w25_end) - overtime_start).total_seconds() / 3600.0
-                        rec.he25 = max(0, he25_hours)
-
-                    # HE50: de 19:00 a 00:00
-                    if actual_out > w25_end:
-                        he50_hours = (min(actual_out,
-                                          w50_end) - w25_end).total_seconds() / 3600.0
-                        rec.he50 = max(0, he50_hours)
-
-                    # HE75: de 00:00 a 05:00
-                    if actual_out > w75_start:
-                        he75_hours = (min(actual_out,
-                                          w75_end) - w75_start).total_seconds() / 3600.0
-                        rec.he75 = max(0, he75_hours)
-
-            # ——————————————————————————————
-            # 4) Caso: 60h/semana NOCTURNO
-            # ——————————————————————————————
-            elif full_req == 60 and nocturna:
-                # Jornada esperada: 18:00-06:00 (cruza medianoche)
-                # ORDINARIAS: 18:00-01:00 (7 horas normales)
-                # HE75: 01:00-06:00 (5 horas extra al 75%)
-
-                ordinary_start = datetime.combine(day, time(18, 0))  # 18:00
-                ordinary_end = datetime.combine(day + timedelta(days=1),
-                                                time(1, 0))  # 01:00
-                he75_start = ordinary_end  # 01:00
-                he75_end = datetime.combine(day + timedelta(days=1), time(6, 0))  # 06:00
-
-                # Solo calcular HE75 si trabaja después de la 01:00
-                if actual_out > he75_start:
-                    rec.he75 = max(0, (min(actual_out,
-                                           he75_end) - he75_start).total_seconds() / 3600.0)
-
-                # No hay HE25 ni HE50 en jornada nocturna estándar
-                # Las primeras 7 horas (18:00-01:00) son tiempo ordinario
-
-            # ——————————————————————————————
-            # 5) Caso: 44h/semana DIURNO
-            # ——————————————————————————————
-            elif full_req == 44 and not nocturna:
-                # Solo procesar si hay líneas de calendario
-                if not lines:
-                    continue
-
-                # Horario esperado: 07:30-16:30
-                # 07:30-15:30 = 8h ordinarias
-                # 15:30-16:30 = 1h acumulada para sábado
-                # 16:30-19:00 = HE25
-                # 19:00-22:00 = HE50
-                # 22:00-06:00 = HE75
-
-                # Puntos de tiempo importantes
-                ordinary_end = datetime.combine(day, time(15, 30))  # Fin de 8h ordinarias
-                saturday_acum_end = datetime.combine(day, time(16,
-                                                               30))  # Fin de hora acumulada
-                he25_end = datetime.combine(day, time(19, 0))  # Fin de HE25
-                he50_end = datetime.combine(day, time(22, 0))  # Fin de HE50
-                he75_end = datetime.combine(day + timedelta(days=1),
-                                            time(6, 0))  # Fin de HE75
-
-                # 1) Hora acumulada para sábado: 15:30-16:30
-                if actual_out > ordinary_end:
-                    sabado_hours = (min(actual_out,
-                                        saturday_acum_end) - ordinary_end).total_seconds() / 3600.0
-                    rec.sabado_acum = max(0, sabado_hours)
-
-                # 2) HE25: 16:30-19:00
-                if actual_out > saturday_acum_end:
-                    he25_hours = (min(actual_out,
-                                      he25_end) - saturday_acum_end).total_seconds() / 3600.0
-                    rec.he25 = max(0, he25_hours)
-
-                # 3) HE50: 19:00-22:00
-                if actual_out > he25_end:
-                    he50_hours = (min(actual_out,
-                                      he50_end) - he25_end).total_seconds() / 3600.0
-                    rec.he50 = max(0, he50_hours)
-
-                # 4) HE75: 22:00-06:00 (cruza medianoche)
-                if actual_out > he50_end:
-                    he75_hours = (min(actual_out,
-                                      he75_end) - he50_end).total_seconds() / 3600.0
-                    rec.he75 = max(0, he75_hours)
-
-            # ——————————————————————————————
-            # 6) Redondeo final
-            # ——————————————————————————————
-            rec.he25 = round(rec.he25, 2)
-            rec.he50 = round(rec.he50, 2)
-            rec.he75 = round(rec.he75, 2)
-            rec.sabado_acum = round(rec.sabado_acum, 2)
+            key = (contract.full_time_required_hours or 0, calendar.id, bool(calendar.nocturna))
+            groups[key].append(rec)
+        return groups, line_days
+
+    @api.model
+    def _he_compute_values(self, local_check_in, local_check_out, bands, detail=None):
+        """Horas extra de una marcación ya convertida a hora local.
+
+        Cada franja ``(inicio, fin, tipo, mínimo)`` en minutos desde la medianoche
+        del día de entrada se intersecta con el tiempo trabajado; ``mínimo`` retrasa
+        el inicio hasta haber trabajado esos minutos. Si se pasa ``detail`` se le
+        agrega ``(inicio, fin, tipo, minutos)`` por cada franja evaluada.
+
+        :returns: dict con los valores redondeados de ``HE_FIELDS``.
+        """
+        midnight = datetime.combine(local_check_in.date(), time.min)
+        in_min = (local_check_in - midnight).total_seconds() / 60.0
+        out_min = (local_check_out - midnight).total_seconds() / 60.0
+
+        minutes = dict.fromkeys(HE_FIELDS, 0.0)
+        for start, end, bucket, min_worked in bands:
+            if start >= out_min:
+                break
+            overlap = min(end, out_min) - max(start, in_min + min_worked)
+            if overlap > 0:
+                minutes[bucket] += overlap
+            if detail is not None:
+                detail.append((start, end, bucket, max(overlap, 0.0)))
+        return {fname: round(value / 60.0, 2) for fname, value in minutes.items()}
 
     def action_recompute_he(self):
-        """Botón para forzar el recálculo de horas extra en este registro."""
+        """Botón para forzar el recálculo de horas extra de la selección.
+
+        Las selecciones grandes se encolan para el cron de recálculo.
+        """
         try:
-            # Escribir directamente en la base de datos para forzar el reseteo
-            for rec in self:
-                # Reseteo directo en BD
-                rec.write({
-                    'he25': 0.0,
-                    'he50': 0.0,
-                    'he75': 0.0,
-                    'sabado_acum': 0.0
-                })
-
-            # Invalidar caché y recalcular
-            self.invalidate_recordset(['he25', 'he50', 'he75', 'sabado_acum'])
-            self._compute_he_franjas()
-
-            # Mensaje de confirmación
-            message = f"Recálculo completado:\n"
-            for rec in self:
-                message += f"• HE25: {rec.he25:.2f}h\n"
-                message += f"• HE50: {rec.he50:.2f}h\n"
-                message += f"• HE75: {rec.he75:.2f}h\n"
-                message += f"• Sábado Acum: {rec.sabado_acum:.2f}h"
+            threshold = int(self.env['ir.config_parameter'].sudo().get_param(
+                'kc_payroll_full.he_recompute_async_threshold', 5000))
+            if threshold and len(self) > threshold:
+                self._enqueue_he_recompute()
+                return {
+                    'type': 'ir.actions.client',
+                    'tag': 'display_notification',
+                    'params': {
+                        'title': 'Recálculo en Segundo Plano',
+                        'message': f"{len(self)} asistencias en cola para recálculo.",
+                        'type': 'info',
+                        'sticky': False,
+                    }
+                }
+
+            # si falla, el reseteo a cero no debe quedar confirmado
+            with self.env.cr.savepoint():
+                self._recompute_he()
+            totals = self._he_totals()
+            message = (f"Recálculo completado: {totals['count']} asistencias\n"
+                       f"• HE25: {totals['he25']:.2f}h\n"
+                       f"• HE50: {totals['he50']:.2f}h\n"
+                       f"• HE75: {totals['he75']:.2f}h\n"
+                       f"• Sábado Acum: {totals['sabado_acum']:.2f}h")
 
             return {
                 'type': 'ir.actions.client',
@@ -321,228 +300,249 @@ class HRAttendance(models.Model):
                 }
             }
 
+    def _recompute_he(self, chunk_size=1000):
+        """Resetear y recalcular las horas extra en bloques.
+
+        El reseteo es una sola sentencia y quita la marca de recálculo
+        pendiente; cada bloque se recalcula con el motor por lotes y se escribe
+        en la base de datos antes de pasar al siguiente.
+        """
+        if not self:
+            return
+        self.flush_model(['employee_id', 'check_in', 'check_out', 'he_recompute_pending',
+                          *HE_FIELDS])
+        self.env.cr.execute("""
+            UPDATE hr_attendance
+               SET he25 = 0, he50 = 0, he75 = 0, sabado_acum = 0,
+                   he_recompute_pending = FALSE
+             WHERE id = ANY(%s)
+        """, [self.ids])
+        self.invalidate_recordset([*HE_FIELDS, 'he_recompute_pending'])
+
+        he_fields = [self._fields[fname] for fname in HE_FIELDS]
+        for ids in split_every(chunk_size, self.ids):
+            chunk = self.browse(ids)
+            for field in he_fields:
+                self.env.add_to_compute(field, chunk)
+            chunk.flush_recordset(list(HE_FIELDS))
+            chunk._mark_attendance_weeks()
+            chunk.invalidate_recordset()
+
+    def _he_totals(self):
+        """Cantidad de asistencias y suma de cada franja para la selección."""
+        self.env.cr.execute("""
+            SELECT COUNT(*), COALESCE(SUM(he25), 0), COALESCE(SUM(he50), 0),
+                   COALESCE(SUM(he75), 0), COALESCE(SUM(sabado_acum), 0)
+              FROM hr_attendance
+             WHERE id = ANY(%s)
+        """, [self.ids])
+        count, *sums = self.env.cr.fetchone()
+        return dict(zip(HE_FIELDS, sums), count=count)
+
+    def _enqueue_he_recompute(self):
+        """Marcar la selección como pendiente y disparar el cron de recálculo."""
+        self.flush_model(['he_recompute_pending'])
+        self.env.cr.execute("""
+            UPDATE hr_attendance SET he_recompute_pending = TRUE WHERE id = ANY(%s)
+        """, [self.ids])
+        self.invalidate_recordset(['he_recompute_pending'])
+        self.env.ref('kc_payroll_full.ir_cron_recompute_he')._trigger()
+
+    @api.model
+    def _cron_recompute_he(self, chunk_size=1000):
+        """Procesar las asistencias pendientes de recálculo, confirmando por bloque."""
+        while True:
+            records = self.search([('he_recompute_pending', '=', True)], limit=chunk_size)
+            if not records:
+                break
+            records._recompute_he(chunk_size=chunk_size)
+            self.env.cr.commit()
+
+    def action_recompute_he_bulk(self):
+        """Recalcular masivamente las horas extra de la selección (motor vectorizado)."""
+        count = self._recompute_he_vectorized()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Horas Extra Recalculadas',
+                'message': f"{count} asistencias recalculadas.",
+                'type': 'success',
+                'sticky': False,
+            }
+        }
+
+    def _recompute_he_vectorized(self, chunk_size=200000):
+        """Recalcular las horas extra con NumPy, para recálculos de meses o años.
+
+        Las marcaciones se leen como epoch int64, las franjas se evalúan por
+        recorte de intervalos sobre arreglos y el resultado se escribe con un
+        ``UPDATE ... FROM (VALUES ...)`` por bloque. Da los mismos valores que
+        ``_compute_he_franjas``.
+
+        :returns: número de asistencias actualizadas.
+        """
+        self.flush_model(['employee_id', 'check_in', 'check_out', 'he_recompute_pending',
+                          *HE_FIELDS])
+        setups = {}
+        count = 0
+
+        for ids in split_every(chunk_size, self.ids):
+            self.env.cr.execute("""
+                SELECT id, employee_id,
+                       COALESCE(EXTRACT(EPOCH FROM check_in), 0)::bigint,
+                       COALESCE(EXTRACT(EPOCH FROM check_out), 0)::bigint,
+                       (check_in IS NOT NULL AND check_out IS NOT NULL)
+                  FROM hr_attendance
+                 WHERE id = ANY(%s)
+            """, [list(ids)])
+            data = np.array(self.env.cr.fetchall(), dtype=np.int64).reshape(-1, 5)
+            if not len(data):
+                continue
+            att_ids, employee_ids, check_in, check_out, valid = data.T
+
+            # Configuración (horas, calendario, nocturna) y zona horaria por empleado
+            employees, inverse = np.unique(employee_ids, return_inverse=True)
+            self._he_prepare_employees(employees.tolist(), setups)
+            setup_list = [setups[employee_id] for employee_id in employees.tolist()]
+            group_keys = sorted({setup[0] for setup in setup_list if setup}, key=str)
+            group_idx = np.array(
+                [group_keys.index(setup[0]) if setup else -1 for setup in setup_list])[inverse]
+
+            # Desfase UTC por zona horaria con la tabla de transiciones en caché
+            employee_tz = [(setup and setup[1]) or local_time.DEFAULT_TZ for setup in setup_list]
+            tz_names = sorted(set(employee_tz))
+            tz_idx = np.array([tz_names.index(tz_name) for tz_name in employee_tz])[inverse]
+            offset_in = np.zeros_like(check_in)
+            offset_out = np.zeros_like(check_out)
+            for idx, tz_name in enumerate(tz_names):
+                mask = tz_idx == idx
+                offset_in[mask] = local_time.utc_offsets(tz_name, check_in[mask])
+                offset_out[mask] = local_time.utc_offsets(tz_name, check_out[mask])
+
+            # Hora local en minutos desde la medianoche del día de entrada
+            local_in = check_in + offset_in
+            local_out = check_out + offset_out
+            local_day = local_in // 86400
+            in_min = (local_in - local_day * 86400) / 60.0
+            out_min = (local_out - local_day * 86400) / 60.0
+            local_wd = (local_day + 3) % 7  # 1970-01-01 fue jueves
+
+            result = np.zeros((len(HE_FIELDS), len(att_ids)))
+            for idx, (full_req, calendar_id, _nocturna) in enumerate(group_keys):
+                calendar = self.env['resource.calendar'].browse(calendar_id)
+                table = calendar._get_overtime_band_table(full_req)
+                mask = (group_idx == idx) & valid.astype(bool)
+                if not table or not mask.any():
+                    continue
+                line_days = set(calendar.attendance_ids.mapped('dayofweek'))
+                result[:, mask] = self._he_compute_arrays(
+                    table, line_days, in_min[mask], out_min[mask], local_wd[mask])
+
+            rows = list(zip(att_ids.tolist(), *result.tolist()))
+            execute_values(self.env.cr._obj, """
+                UPDATE hr_attendance AS a
+                   SET he25 = v.he25, he50 = v.he50, he75 = v.he75, sabado_acum = v.sabado_acum,
+                       he_recompute_pending = FALSE
+                  FROM (VALUES %s) AS v(id, he25, he50, he75, sabado_acum)
+                 WHERE a.id = v.id
+            """, rows, page_size=len(rows))
+            count += len(rows)
+
+            # Semanas afectadas: lunes local de cada entrada, por empleado
+            week_day = local_day - local_wd
+            self.env['hr.attendance.week']._mark_pending({
+                (employee_id, date(1970, 1, 1) + timedelta(days=day))
+                for employee_id, day in set(zip(employee_ids[valid.astype(bool)].tolist(),
+                                                week_day[valid.astype(bool)].tolist()))
+            })
+
+        self.invalidate_model([*HE_FIELDS, 'he_recompute_pending'])
+        return count
+
+    @api.model
+    def _he_prepare_employees(self, employee_ids, setups):
+        """Completar ``setups`` con ``(clave, zona horaria)`` de cada empleado.
+
+        La clave es (horas, calendario, nocturna); el valor es ``None`` si el
+        empleado no tiene contrato o calendario.
+        """
+        missing = [employee_id for employee_id in employee_ids if employee_id not in setups]
+        for employee in self.env['hr.employee'].browse(missing):
+            contract = employee.contract_id
+            calendar = contract.resource_calendar_id or employee.resource_calendar_id
+            setups[employee.id] = (
+                ((contract.full_time_required_hours or 0, calendar.id, bool(calendar.nocturna)),
+                 employee.tz or calendar.tz)
+                if contract and calendar else None
+            )
+
+    @api.model
+    def _he_compute_arrays(self, table, line_days, in_min, out_min, local_wd):
+        """Versión vectorizada de ``_he_compute_values`` para un mismo calendario.
+
+        :returns: arreglo ``(len(HE_FIELDS), n)`` con las horas redondeadas.
+        """
+        result = np.zeros((len(HE_FIELDS), len(in_min)))
+        allowed = np.array([
+            str(weekday) in line_days or table.get(weekday, (False, ()))[0]
+            for weekday in range(7)
+        ])
+        gate = allowed[local_wd]
+        for weekday, (_without_schedule, bands) in table.items():
+            mask = gate & (local_wd == weekday)
+            if not mask.any():
+                continue
+            day_in = in_min[mask]
+            day_out = out_min[mask]
+            for start, end, bucket, min_worked in bands:
+                overlap = np.minimum(end, day_out) - np.maximum(start, day_in + min_worked)
+                result[HE_FIELDS.index(bucket), mask] += np.clip(overlap, 0, None)
+        hours = result / 60.0
+        rounded = np.round(hours, 2)
+        # cerca de un empate np.round (x * 100) puede diferir de round(): esos
+        # valores se redondean como en _he_compute_values
+        ties = np.abs(hours * 100 % 1 - 0.5) < 1e-6
+        rounded[ties] = [round(value, 2) for value in hours[ties].tolist()]
+        return rounded
+
     def debug_he_calculation(self):
         """Método de debug para verificar el cálculo paso a paso."""
+        weekday_names = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes',
+                         'Sábado', 'Domingo']
+        bucket_names = dict(HE_BUCKETS)
         debug_info = []
 
-        for rec in self:
+        for rec, values, decision in self._he_evaluate(trace=True):
             info = f"🔍 DEBUG: {rec.employee_id.name}\n"
+            if 'check_in' in decision:
+                info += f"├── Check-in LOCAL: {decision['check_in']}\n"
+                info += f"├── Check-out LOCAL: {decision['check_out']}\n"
+                info += f"├── TZ empleado: {decision['tz'] or local_time.DEFAULT_TZ}\n"
+            if 'calendar' in decision:
+                calendar = self.env['resource.calendar'].browse(decision['calendar'])
+                info += f"├── Horas requeridas: {decision['full_req']}\n"
+                info += f"├── Calendario: {calendar.name}\n"
+                info += f"├── Nocturna: {decision['nocturna']}\n"
+                info += f"├── Franjas: {decision['source']}\n"
+            if 'weekday' in decision:
+                weekday = decision['weekday']
+                info += f"├── Día: {weekday_names[weekday]} (código: {weekday})\n"
 
-            # Convertir a timezone del usuario para mostrar
-            user_tz = pytz.timezone(self.env.user.tz or 'America/Tegucigalpa')
-
-            # Convertir check_in y check_out a timezone local
-            if rec.check_in.tzinfo:
-                check_in_local = rec.check_in.astimezone(user_tz).replace(tzinfo=None)
-            else:
-                check_in_utc = pytz.UTC.localize(rec.check_in)
-                check_in_local = check_in_utc.astimezone(user_tz).replace(tzinfo=None)
-
-            if rec.check_out.tzinfo:
-                check_out_local = rec.check_out.astimezone(user_tz).replace(tzinfo=None)
-            else:
-                check_out_utc = pytz.UTC.localize(rec.check_out)
-                check_out_local = check_out_utc.astimezone(user_tz).replace(tzinfo=None)
-
-            info += f"├── Check-in LOCAL: {check_in_local}\n"
-            info += f"├── Check-out LOCAL: {check_out_local}\n"
-            info += f"├── User TZ: {self.env.user.tz or 'America/Tegucigalpa'}\n"
-
-            if not (rec.check_in and rec.check_out):
-                info += "❌ FALTA check_in o check_out"
-                debug_info.append(info)
-                continue
-
-            contract = rec.employee_id.contract_id
-            if not contract:
-                info += "❌ SIN CONTRATO ACTIVO"
-                debug_info.append(info)
-                continue
-
-            calendar = contract.resource_calendar_id or rec.employee_id.resource_calendar_id
-            if not calendar:
-                info += "❌ SIN CALENDARIO"
+            if decision.get('skip'):
+                info += f"❌ {decision['skip'].upper()}"
                 debug_info.append(info)
                 continue
 
-            info += f"├── Horas requeridas: {contract.full_time_required_hours}\n"
-            info += f"├── Calendario: {calendar.name}\n"
-
-            # Verificar campo nocturna
-            nocturna = getattr(calendar, 'nocturna', False)
-            info += f"├── Nocturna: {nocturna}\n"
-
-            # Día de semana
-            dow = str(check_in_local.weekday())
-            lines = calendar.attendance_ids.filtered(lambda l: l.dayofweek == dow)
-
-            full_req = contract.full_time_required_hours or 0
-
-            if not lines:
-                # Verificar si es caso especial de sábado 60h diurno
-                if full_req == 60 and not nocturna and check_in_local.weekday() == 5:
-                    info += f"├── ⚠️ SIN LÍNEAS PARA SÁBADO - Pero aplicando lógica especial\n"
-                else:
-                    info += f"❌ SIN LÍNEAS PARA DÍA {dow} (lunes=0)"
-                    debug_info.append(info)
-                    continue
-            else:
-                info += f"├── Líneas encontradas: {len(lines)}\n"
-                for i, line in enumerate(lines):
-                    info += f"├── Línea {i + 1}: {line.hour_from:.2f} - {line.hour_to:.2f}\n"
-
-                # Mostrar cálculo detallado solo si hay líneas
-                if lines:
-                    day = check_in_local.date()
-                    first_line = lines[0]
-                    last_line = lines[-1]
-
-                    # Usar función auxiliar para convertir horas de forma segura
-                    sched_start = rec._safe_time_from_float(day, first_line.hour_from)
-                    sched_end = rec._safe_time_from_float(day, last_line.hour_to)
-
-                    info += f"├── Jornada COMPLETA: {sched_start.time()} - {sched_end.time()}\n"
-                    info += f"├── Datos calendario: {first_line.hour_from:.2f} - {last_line.hour_to:.2f}\n"
-
-                # Calcular duración real
-                duration = (check_out_local - check_in_local).total_seconds() / 3600
-                info += f"├── Duración real: {duration:.2f}h\n"
-
-            # Mostrar ventanas de HE según el tipo
-            if full_req == 60 and not nocturna:
-                weekday = check_in_local.weekday()
-                weekday_names = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes',
-                                 'Sábado', 'Domingo']
-
-                info += f"├── Día: {weekday_names[weekday]} (código: {weekday})\n"
-                info += f"├── Modo: 60h DIURNO\n"
-
-                if weekday == 5:  # Sábado
-                    info += f"├── 🌟 SÁBADO DETECTADO - Todo es HE25\n"
-                    duration = (check_out_local - check_in_local).total_seconds() / 3600
-                    info += f"├── Duración total: {duration:.2f}h\n"
-                    info += f"├── HE25 asignado: {duration:.2f}h (toda la jornada)\n"
-                elif weekday == 4:  # Viernes
-                    info += f"├── 🌟 VIERNES DETECTADO - Horario especial\n"
-                    info += f"├── Ordinarias: 06:00-14:00 (8h normales)\n"
-                    info += f"├── HE25: 14:00-18:00 (4h extra)\n"
-                    info += f"├── Después 18:00: HE50 y HE75 normales\n"
-
-                    day = check_in_local.date()
-                    ordinary_end = datetime.combine(day, time(14, 0))
-                    he25_end = datetime.combine(day, time(18, 0))
-
-                    if check_out_local <= ordinary_end:
-                        info += f"├── Solo tiempo ordinario (salió a las {check_out_local.time()})\n"
-                    elif check_out_local <= he25_end:
-                        he25_calc = (
-                                                check_out_local - ordinary_end).total_seconds() / 3600
-                        info += f"├── HE25 calculado: {he25_calc:.2f}h (desde 14:00 hasta {check_out_local.time()})\n"
-                    else:
-                        he25_calc = (
-                                                he25_end - ordinary_end).total_seconds() / 3600  # 4h completas
-                        info += f"├── HE25 calculado: {he25_calc:.2f}h (14:00-18:00 completo)\n"
-
-                        if check_out_local > he25_end:
-                            overtime_after_18 = (
-                                                            check_out_local - he25_end).total_seconds() / 3600
-                            info += f"├── Tiempo extra después 18:00: {overtime_after_18:.2f}h\n"
-                else:
-                    # Lógica normal para días de lunes a jueves
-                    day = check_in_local.date()
-                    eight_hours_from_checkin = check_in_local + timedelta(hours=8)
-                    fixed_overtime_start = datetime.combine(day, time(15, 0))
-                    overtime_start = max(eight_hours_from_checkin, fixed_overtime_start)
-
-                    info += f"├── 8h desde check-in: {eight_hours_from_checkin.time()}\n"
-                    info += f"├── Umbral fijo 15:00: {fixed_overtime_start.time()}\n"
-                    info += f"├── HE empiezan desde: {overtime_start.time()}\n"
-
-                    if check_out_local <= overtime_start:
-                        info += f"├── Sin HE (salió a las {check_out_local.time()}, antes de {overtime_start.time()})\n"
-                    else:
-                        overtime_hours = (
-                                                     check_out_local - overtime_start).total_seconds() / 3600
-                        info += f"├── Tiempo en HE: {overtime_hours:.2f}h\n"
-
-                        # Mostrar cálculo detallado de cada franja
-                        w25_end = datetime.combine(day, time(19, 0))
-                        if check_out_local <= w25_end:
-                            he25_calc = (
-                                                    check_out_local - overtime_start).total_seconds() / 3600
-                            info += f"├── HE25 calculado: {he25_calc:.2f}h (desde {overtime_start.time()} hasta {check_out_local.time()})\n"
-                        else:
-                            he25_calc = (w25_end - overtime_start).total_seconds() / 3600
-                            he50_calc = (check_out_local - w25_end).total_seconds() / 3600
-                            info += f"├── HE25 calculado: {he25_calc:.2f}h (desde {overtime_start.time()} hasta 19:00)\n"
-                            info += f"├── HE50 calculado: {he50_calc:.2f}h (desde 19:00 hasta {check_out_local.time()})\n"
-
-                        info += f"├── Ventanas: HE25(hasta 19:00) | HE50(19:00-00:00) | HE75(00:00-05:00)\n"
-
-            elif full_req == 44 and not nocturna:
-                info += f"├── Modo: 44h DIURNO\n"
-                info += f"├── Ordinarias: 07:30-15:30 (8h normales)\n"
-                info += f"├── Sábado Acum: 15:30-16:30 (1h acumulada)\n"
-                info += f"├── HE25: 16:30-19:00\n"
-                info += f"├── HE50: 19:00-22:00\n"
-                info += f"├── HE75: 22:00-06:00\n"
-
-                # Mostrar cálculo detallado
-                day = check_in_local.date()
-                ordinary_end = datetime.combine(day, time(15, 30))
-                saturday_acum_end = datetime.combine(day, time(16, 30))
-                he25_end = datetime.combine(day, time(19, 0))
-                he50_end = datetime.combine(day, time(22, 0))
-
-                if check_out_local <= ordinary_end:
-                    info += f"├── Solo tiempo ordinario (salió a las {check_out_local.time()})\n"
-                elif check_out_local <= saturday_acum_end:
-                    sabado_calc = (check_out_local - ordinary_end).total_seconds() / 3600
-                    info += f"├── Sábado Acum: {sabado_calc:.2f}h (desde 15:30 hasta {check_out_local.time()})\n"
-                elif check_out_local <= he25_end:
-                    sabado_calc = (
-                                              saturday_acum_end - ordinary_end).total_seconds() / 3600
-                    he25_calc = (
-                                            check_out_local - saturday_acum_end).total_seconds() / 3600
-                    info += f"├── Sábado Acum: {sabado_calc:.2f}h (15:30-16:30)\n"
-                    info += f"├── HE25: {he25_calc:.2f}h (desde 16:30 hasta {check_out_local.time()})\n"
-                else:
-                    # Cálculo completo con múltiples franjas
-                    sabado_calc = 1.0  # Siempre 1h completa
-                    he25_calc = (he25_end - saturday_acum_end).total_seconds() / 3600
-                    info += f"├── Sábado Acum: {sabado_calc:.2f}h (15:30-16:30)\n"
-                    info += f"├── HE25: {he25_calc:.2f}h (16:30-19:00)\n"
-
-                    if check_out_local > he25_end:
-                        he50_calc = (min(check_out_local,
-                                         he50_end) - he25_end).total_seconds() / 3600
-                        info += f"├── HE50: {he50_calc:.2f}h (desde 19:00)\n"
-
-                    if check_out_local > he50_end:
-                        he75_calc = (check_out_local - he50_end).total_seconds() / 3600
-                        info += f"├── HE75: {he75_calc:.2f}h (desde 22:00)\n"
-
-            elif full_req == 60 and nocturna:
-                info += f"├── Modo: 60h NOCTURNO\n"
-                info += f"├── Ordinarias: 18:00-01:00 (7h normales)\n"
-                info += f"├── HE75: 01:00-06:00 (5h extra al 75%)\n"
-
-                # Mostrar cálculo detallado
-                day = check_in_local.date()
-                ordinary_start = datetime.combine(day, time(18, 0))
-                ordinary_end = datetime.combine(day + timedelta(days=1), time(1, 0))
-                he75_start = ordinary_end
-                he75_end = datetime.combine(day + timedelta(days=1), time(6, 0))
-
-                if check_out_local <= he75_start:
-                    info += f"├── Solo tiempo ordinario (salió a las {check_out_local.time()}, antes de 01:00)\n"
-                else:
-                    he75_calc = (min(check_out_local,
-                                     he75_end) - he75_start).total_seconds() / 3600
-                    info += f"├── HE75 calculado: {he75_calc:.2f}h (desde 01:00 hasta {min(check_out_local, he75_end).time()})\n"
+            duration = (decision['check_out'] - decision['check_in']).total_seconds() / 3600
+            info += f"├── Duración real: {duration:.2f}h\n"
+            for start, end, bucket, minutes in decision['bands']:
+                info += (f"├── {bucket_names[bucket]} "
+                         f"{self._he_format_minutes(start)}-{self._he_format_minutes(end)}: "
+                         f"{minutes / 60:.2f}h\n")
 
             # Forzar recálculo y mostrar resultado
-            rec._compute_he_franjas()
+            rec.update(values)
             info += f"└── RESULTADO: HE25={rec.he25:.2f} | HE50={rec.he50:.2f} | HE75={rec.he75:.2f} | Sábado Acum={rec.sabado_acum:.2f}"
 
             debug_info.append(info)
@@ -559,4 +559,9 @@ class HRAttendance(models.Model):
                 'type': 'info',
                 'sticky': True,
             }
-        }
\ No newline at end of file
+        }
+
+    @api.model
+    def _he_format_minutes(self, minutes):
+        """Minutos desde la medianoche como HH:MM (24:00 o más es el día siguiente)."""
+        return "%02d:%02d" % divmod(int(minutes), 60)
@@ -0,0 +1,155 @@
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+from . import local_time
+
+# Hora local de la entrada, en la zona horaria del empleado
+LOCAL_CHECK_IN_SQL = "timezone(COALESCE(r.tz, %(tz)s), a.check_in AT TIME ZONE 'UTC')"
+
+PENDING_KEY = 'kc_payroll_full.attendance_weeks'
+
+# Columnas de totales, actualizadas al volver a calcular una semana
+VALUE_FIELDS = (
+    'worked_hours', 'he25', 'he50', 'he75', 'sabado_acum',
+    'weekday_worked_hours', 'weekday_he25', 'weekday_he50', 'weekday_he75',
+)
+
+
+class HrAttendanceWeek(models.Model):
+    _name = 'hr.attendance.week'
+    _description = 'Acumulado Semanal de Asistencias'
+    _order = 'week_start desc, employee_id'
+    _rec_name = 'employee_id'
+
+    employee_id = fields.Many2one('hr.employee', string='Empleado', required=True,
+                                  readonly=True, index=True, ondelete='cascade')
+    week_start = fields.Date(string='Inicio de semana', required=True, readonly=True,
+                             index=True, help='Lunes de la semana ISO (hora local).')
+    worked_hours = fields.Float(string='Horas trabajadas', readonly=True)
+    he25 = fields.Float(string='Horas Extra 25%', readonly=True)
+    he50 = fields.Float(string='Horas Extra 50%', readonly=True)
+    he75 = fields.Float(string='Horas Extra 75%', readonly=True)
+    sabado_acum = fields.Float(string='Horas Acumuladas Sábado', readonly=True)
+    weekday_worked_hours = fields.Float(string='Horas trabajadas (lun-vie)', readonly=True)
+    weekday_he25 = fields.Float(string='HE 25% (lun-vie)', readonly=True)
+    weekday_he50 = fields.Float(string='HE 50% (lun-vie)', readonly=True)
+    weekday_he75 = fields.Float(string='HE 75% (lun-vie)', readonly=True)
+
+    _sql_constraints = [
+        ('employee_week_uniq', 'unique(employee_id, week_start)',
+         'Solo puede existir un acumulado por empleado y semana.'),
+    ]
+
+    def init(self):
+        self.env.cr.execute("SELECT 1 FROM hr_attendance_week LIMIT 1")
+        if not self.env.cr.fetchone():
+            self._refresh()
+
+    @api.model
+    def _mark_pending(self, keys):
+        """Registrar semanas ``(employee_id, week_start)`` a recalcular antes del commit."""
+        if not keys:
+            return
+        data = self.env.cr.precommit.data
+        if PENDING_KEY not in data:
+            data[PENDING_KEY] = set()
+            self.env.cr.precommit.add(self._refresh_pending)
+        data[PENDING_KEY].update(keys)
+
+    @api.model
+    def _refresh_pending(self):
+        """Recalcular ya las semanas pendientes de la transacción actual."""
+        keys = self.env.cr.precommit.data.get(PENDING_KEY)
+        if keys:
+            self.sudo()._refresh(set(keys))
+            keys.clear()
+
+    @api.model
+    def _refresh(self, keys=None):
+        """Recalcular los acumulados de las semanas dadas, o de todas si ``keys`` es None.
+
+        Las semanas se insertan o actualizan con ``ON CONFLICT``, así dos
+        transacciones que recalculan la misma semana no chocan con la clave
+        única; solo se borran las semanas que ya no tienen asistencias.
+        """
+        cr = self.env.cr
+        self.env['hr.attendance'].flush_model(
+            ['employee_id', 'check_in', 'check_out', 'worked_hours',
+             'he25', 'he50', 'he75', 'sabado_acum'])
+        params = {'tz': local_time.DEFAULT_TZ, 'uid': self.env.uid}
+        week_sql = f"date_trunc('week', {LOCAL_CHECK_IN_SQL})::date"
+
+        if keys is None:
+            cr.execute("DELETE FROM hr_attendance_week")
+            where = ""
+        else:
+            keys = list(keys)
+            params.update(
+                employees=[employee_id for employee_id, _week in keys],
+                weeks=[week for _employee_id, week in keys],
+                date_min=min(week for _employee_id, week in keys) - timedelta(days=1),
+                date_max=max(week for _employee_id, week in keys) + timedelta(days=8),
+            )
+            where = f"""
+                   AND a.employee_id = ANY(%(employees)s)
+                   AND a.check_in >= %(date_min)s AND a.check_in < %(date_max)s
+                   AND (a.employee_id, {week_sql}) IN (
+                       SELECT * FROM unnest(%(employees)s::int[], %(weeks)s::date[]))
+            """
+
+        weekday_sql = f"EXTRACT(ISODOW FROM {LOCAL_CHECK_IN_SQL}) <= 5"
+        cr.execute(f"""
+            INSERT INTO hr_attendance_week (
+                employee_id, week_start, worked_hours, he25, he50, he75, sabado_acum,
+                weekday_worked_hours, weekday_he25, weekday_he50, weekday_he75,
+                create_uid, create_date, write_uid, write_date)
+            SELECT a.employee_id, {week_sql},
+                   SUM(a.worked_hours), SUM(a.he25), SUM(a.he50), SUM(a.he75),
+                   SUM(a.sabado_acum),
+                   COALESCE(SUM(a.worked_hours) FILTER (WHERE {weekday_sql}), 0),
+                   COALESCE(SUM(a.he25) FILTER (WHERE {weekday_sql}), 0),
+                   COALESCE(SUM(a.he50) FILTER (WHERE {weekday_sql}), 0),
+                   COALESCE(SUM(a.he75) FILTER (WHERE {weekday_sql}), 0),
+                   %(uid)s, NOW() AT TIME ZONE 'UTC', %(uid)s, NOW() AT TIME ZONE 'UTC'
+              FROM hr_attendance a
+              JOIN hr_employee e ON e.id = a.employee_id
+              JOIN resource_resource r ON r.id = e.resource_id
+             WHERE a.check_in IS NOT NULL AND a.check_out IS NOT NULL
+                   {where}
+             GROUP BY 1, 2
+                ON CONFLICT (employee_id, week_start) DO UPDATE SET
+                   {', '.join(f'{fname} = EXCLUDED.{fname}' for fname in VALUE_FIELDS)},
+                   write_uid = EXCLUDED.write_uid, write_date = EXCLUDED.write_date
+         RETURNING employee_id, week_start
+        """, params)
+
+        if keys is not None:
+            # semanas que se quedaron sin asistencias
+            stale = set(keys).difference(cr.fetchall())
+            if stale:
+                cr.execute("""
+                    DELETE FROM hr_attendance_week w
+                     USING unnest(%s::int[], %s::date[]) AS k(employee_id, week_start)
+                     WHERE w.employee_id = k.employee_id AND w.week_start = k.week_start
+                """, [[employee_id for employee_id, _week in stale],
+                      [week for _employee_id, week in stale]])
+        self.invalidate_model()
+
+    @api.model
+    def _get_weekday_totals(self, employee, date_from, date_to):
+        """Totales de lunes a viernes de las semanas que empiezan entre las fechas.
+
+        :returns: dict con ``worked_hours``, ``he25``, ``he50`` y ``he75``.
+        """
+        self._refresh_pending()
+        # lectura interna del cálculo de nómina, sin depender del acceso al menú
+        weeks = self.sudo().search_read([
+            ('employee_id', '=', employee.id),
+            ('week_start', '>=', date_from),
+            ('week_start', '<=', date_to),
+        ], ['weekday_worked_hours', 'weekday_he25', 'weekday_he50', 'weekday_he75'])
+        return {
+            fname: sum(week[f'weekday_{fname}'] for week in weeks)
+            for fname in ('worked_hours', 'he25', 'he50', 'he75')
+        }
@@ -4,6 +4,8 @@ import math
 import pytz
 
 from collections import defaultdict, Counter
+from contextlib import contextmanager
+from time import perf_counter
 from datetime import date, datetime, time
 from dateutil.relativedelta import relativedelta
 
@@ -15,6 +17,10 @@ from odoo.tools.float_utils import float_compare
 from odoo.tools.misc import format_date
 from odoo.tools.safe_eval import safe_eval
 
+from . import local_time
+from .hr_attendance_week import LOCAL_CHECK_IN_SQL
+from .hr_payslip_run import PROFILE_KEY, PROFILE_STAGES
+
 _logger = logging.getLogger(__name__)
 
 
@@ -26,58 +32,43 @@ class HrPayslip(models.Model):
 
     def _get_worked_day_lines_values(self, domain=None):
         self.ensure_one()
+        timings = dict.fromkeys(PROFILE_STAGES, 0.0)
         res = []
         hours_per_day = self._get_worked_day_lines_hours_per_day()
-        work_hours = self.contract_id.get_work_hours(self.date_from, self.date_to,
-                                                     domain=domain)
+        with self._profile_stage(timings, 'work_hours'):
+            work_hours = self.contract_id.get_work_hours(self.date_from, self.date_to,
+                                                         domain=domain)
         work_hours_ordered = sorted(work_hours.items(), key=lambda x: x[1])
         biggest_work = work_hours_ordered[-1][0] if work_hours_ordered else 0
         add_days_rounding = 0
 
-        # Buscar los tipos de entrada de trabajo por código
-        attendance_work_entry_type = self.env['hr.work.entry.type'].search(
-            [('code', '=', 'WORK100')], limit=1)
+        # Tipos de entrada de trabajo por código (mapa en caché)
+        WorkEntryType = self.env['hr.work.entry.type']
+        with self._profile_stage(timings, 'work_entry'):
+            attendance_work_entry_type = WorkEntryType._get_by_code('WORK100')
 
-        # Buscar tipos de entrada para horas extras por franjas
-        he25_work_entry_type = self.env['hr.work.entry.type'].search(
-            [('code', '=', 'HE25')], limit=1)
-        he50_work_entry_type = self.env['hr.work.entry.type'].search(
-            [('code', '=', 'HE50')], limit=1)
-        he75_work_entry_type = self.env['hr.work.entry.type'].search(
-            [('code', '=', 'HE75')], limit=1)
+            # Tipos de entrada para horas extras por franjas
+            he25_work_entry_type = WorkEntryType._get_by_code('HE25')
+            he50_work_entry_type = WorkEntryType._get_by_code('HE50')
+            he75_work_entry_type = WorkEntryType._get_by_code('HE75')
 
         # Usar un conjunto para almacenar los tipos de trabajo ya procesados
         processed_entry_types = set()
 
-        # FILTRAR ASISTENCIAS SOLO DE LUNES A VIERNES
-        all_attendances = self.env['hr.attendance'].search([
-            ('employee_id', '=', self.employee_id.id),
-            ('check_in', '>=', self.date_from),
-            ('check_out', '<=', self.date_to),
-        ])
-
-        # Filtrar solo días laborables (lunes=0 a viernes=4)
-        weekday_attendances = []
-        for att in all_attendances:
-            if att.check_in:
-                weekday = att.check_in.weekday()  # 0=lunes, 6=domingo
-                if 0 <= weekday <= 4:  # lunes a viernes
-                    weekday_attendances.append(att)
-
-        print("Asistencias filtradas (lun-vie):", len(weekday_attendances))
-
-        # Sumar las horas dentro del horario laboral (solo días laborables)
-        in_work_hours = sum(att.worked_hours for att in weekday_attendances)
-        print('HORAS DE ENTRADA (lun-vie):', in_work_hours)
+        # Totales de lunes a viernes: de los acumulados semanales si el periodo
+        # cubre semanas completas, si no con una consulta agrupada
+        with self._profile_stage(timings, 'attendance'):
+            if self.date_from.weekday() == 0 and self.date_to.weekday() == 6:
+                totals = self.env['hr.attendance.week']._get_weekday_totals(
+                    self.employee_id, self.date_from, self.date_to)
+            else:
+                totals = self._get_attendance_weekday_totals()[self.id]
 
-        # Calcular totales de horas extras por franja (solo días laborables)
-        total_he25 = sum(att.he25 for att in weekday_attendances)
-        total_he50 = sum(att.he50 for att in weekday_attendances)
-        total_he75 = sum(att.he75 for att in weekday_attendances)
-
-        print('HORAS EXTRA 25% (lun-vie):', total_he25)
-        print('HORAS EXTRA 50% (lun-vie):', total_he50)
-        print('HORAS EXTRA 75% (lun-vie):', total_he75)
+        aggregation_start = perf_counter()
+        in_work_hours = totals['worked_hours']
+        total_he25 = totals['he25']
+        total_he50 = totals['he50']
+        total_he75 = totals['he75']
 
         # Línea para WORK100 (horas dentro del horario laboral - solo días laborables)
         if in_work_hours > 0 and attendance_work_entry_type:
@@ -87,7 +78,7 @@ class HrPayslip(models.Model):
                 in_work_rounded = self._round_days(attendance_work_entry_type,
                                                    in_work_days)
                 res.append({
-                    'sequence': attendance_work_entry_type.sequence,
+                    'sequence': WorkEntryType._get_cached_sequence(attendance_work_entry_type.id),
                     'work_entry_type_id': attendance_work_entry_type.id,
                     'number_of_days': in_work_rounded,
                     'number_of_hours': in_work_hours,
@@ -100,7 +91,7 @@ class HrPayslip(models.Model):
                 he25_days = round(total_he25 / hours_per_day, 5) if hours_per_day else 0
                 he25_rounded = self._round_days(he25_work_entry_type, he25_days)
                 res.append({
-                    'sequence': he25_work_entry_type.sequence,
+                    'sequence': WorkEntryType._get_cached_sequence(he25_work_entry_type.id),
                     'work_entry_type_id': he25_work_entry_type.id,
                     'number_of_days': he25_rounded,
                     'number_of_hours': total_he25,
@@ -113,7 +104,7 @@ class HrPayslip(models.Model):
                 he50_days = round(total_he50 / hours_per_day, 5) if hours_per_day else 0
                 he50_rounded = self._round_days(he50_work_entry_type, he50_days)
                 res.append({
-                    'sequence': he50_work_entry_type.sequence,
+                    'sequence': WorkEntryType._get_cached_sequence(he50_work_entry_type.id),
                     'work_entry_type_id': he50_work_entry_type.id,
                     'number_of_days': he50_rounded,
                     'number_of_hours': total_he50,
@@ -126,7 +117,7 @@ class HrPayslip(models.Model):
                 he75_days = round(total_he75 / hours_per_day, 5) if hours_per_day else 0
                 he75_rounded = self._round_days(he75_work_entry_type, he75_days)
                 res.append({
-                    'sequence': he75_work_entry_type.sequence,
+                    'sequence': WorkEntryType._get_cached_sequence(he75_work_entry_type.id),
                     'work_entry_type_id': he75_work_entry_type.id,
                     'number_of_days': he75_rounded,
                     'number_of_hours': total_he75,
@@ -135,7 +126,7 @@ class HrPayslip(models.Model):
 
         # Resto de la lógica original...
         for work_entry_type_id, hours in work_hours_ordered:
-            work_entry_type = self.env['hr.work.entry.type'].browse(work_entry_type_id)
+            work_entry_type = WorkEntryType.browse(work_entry_type_id)
             if work_entry_type.id not in processed_entry_types:
                 days = round(hours / hours_per_day, 5) if hours_per_day else 0
                 if work_entry_type_id == biggest_work:
@@ -143,7 +134,7 @@ class HrPayslip(models.Model):
                 day_rounded = self._round_days(work_entry_type, days)
                 add_days_rounding += (days - day_rounded)
                 attendance_line = {
-                    'sequence': work_entry_type.sequence,
+                    'sequence': WorkEntryType._get_cached_sequence(work_entry_type_id),
                     'work_entry_type_id': work_entry_type_id,
                     'number_of_days': day_rounded,
                     'number_of_hours': hours,
@@ -152,9 +143,76 @@ class HrPayslip(models.Model):
                 processed_entry_types.add(work_entry_type.id)
 
         # Ordenar las líneas por secuencia
-        work_entry_type = self.env['hr.work.entry.type']
-        return sorted(res, key=lambda d: work_entry_type.browse(
-            d['work_entry_type_id']).sequence)
+        res = sorted(res, key=lambda d: d['sequence'])
+        timings['aggregation'] += (perf_counter() - aggregation_start) * 1000
+        self._record_profile(timings)
+        return res
+
+    @contextmanager
+    def _profile_stage(self, timings, stage):
+        """Sumar a ``timings[stage]`` los milisegundos del bloque."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            timings[stage] += (perf_counter() - start) * 1000
+
+    def _record_profile(self, timings):
+        """Acumular los tiempos de la nómina en su lote (se escriben antes del commit).
+
+        Un rollback descarta lo acumulado; si el cálculo de un bloque se revierte
+        a un savepoint, :meth:`hr.payslip.run.chunk._process` lo descarta.
+        """
+        self.ensure_one()
+        _logger.debug("Tiempos de la nómina %s (ms): %s", self.id, timings)
+        if not self.payslip_run_id:
+            return
+        data = self.env.cr.precommit.data
+        if PROFILE_KEY not in data:
+            data[PROFILE_KEY] = defaultdict(Counter)
+            self.env.cr.precommit.add(self.env['hr.payslip.run']._flush_profile)
+        profile = data[PROFILE_KEY][self.payslip_run_id.id]
+        profile.update(timings)
+        profile['slips'] += 1
+
+    def _get_attendance_weekday_totals(self):
+        """Sumar horas trabajadas y horas extra de lunes a viernes del periodo.
+
+        Una sola consulta agrupada por nómina, sobre la fecha y el día de la
+        semana locales (zona horaria del empleado) de la entrada. Las nóminas se
+        pasan por posición, así también funciona con las NewId de un onchange.
+
+        :returns: dict ``{payslip_id: {'worked_hours', 'he25', 'he50', 'he75'}}``,
+            también para una sola nómina.
+        """
+        self.env['hr.attendance'].flush_model(
+            ['employee_id', 'check_in', 'check_out', 'worked_hours', 'he25', 'he50', 'he75'])
+        fnames = ('worked_hours', 'he25', 'he50', 'he75')
+        totals = {slip.id: dict.fromkeys(fnames, 0.0) for slip in self}
+        self.env.cr.execute(f"""
+            SELECT p.idx,
+                   COALESCE(SUM(a.worked_hours), 0), COALESCE(SUM(a.he25), 0),
+                   COALESCE(SUM(a.he50), 0), COALESCE(SUM(a.he75), 0)
+              FROM unnest(%(employees)s::int[], %(dates_from)s::date[], %(dates_to)s::date[])
+                   WITH ORDINALITY AS p(employee_id, date_from, date_to, idx)
+              JOIN hr_attendance a ON a.employee_id = p.employee_id
+              JOIN hr_employee e ON e.id = a.employee_id
+              JOIN resource_resource r ON r.id = e.resource_id
+             WHERE a.check_out IS NOT NULL
+               AND a.check_in >= p.date_from - INTERVAL '1 day'
+               AND a.check_in < p.date_to + INTERVAL '2 days'
+               AND ({LOCAL_CHECK_IN_SQL})::date BETWEEN p.date_from AND p.date_to
+               AND EXTRACT(ISODOW FROM {LOCAL_CHECK_IN_SQL}) <= 5
+             GROUP BY p.idx
+        """, {
+            'tz': local_time.DEFAULT_TZ,
+            'employees': [slip.employee_id._origin.id or None for slip in self],
+            'dates_from': [slip.date_from or None for slip in self],
+            'dates_to': [slip.date_to or None for slip in self],
+        })
+        for idx, *values in self.env.cr.fetchall():
+            totals[self[idx - 1].id] = dict(zip(fnames, values))
+        return totals
 
     def _get_worked_day_lines(self, domain=None, check_out_of_contract=True):
         """
@@ -198,11 +256,11 @@ class HrPayslip(models.Model):
                 out_hours += out_time['hours']
 
             if out_days or out_hours:
-                work_entry_type = self.env['hr.work.entry.type'].search(
-                    [('code', '=', 'OUT_OF_CONTRACT')], limit=1)
+                WorkEntryType = self.env['hr.work.entry.type']
+                work_entry_type = WorkEntryType._get_by_code('OUT_OF_CONTRACT')
                 if work_entry_type:
                     res.append({
-                        'sequence': work_entry_type.sequence,
+                        'sequence': WorkEntryType._get_cached_sequence(work_entry_type.id),
                         'work_entry_type_id': work_entry_type.id,
                         'number_of_days': out_days,
                         'number_of_hours': out_hours,
@@ -0,0 +1,209 @@
+import logging
+import time
+
+from odoo import api, Command, fields, models
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+# Etapas medidas en _get_worked_day_lines_values (campos profile_<etapa>_ms)
+PROFILE_STAGES = ('attendance', 'aggregation', 'work_entry', 'work_hours')
+
+PROFILE_KEY = 'kc_payroll_full.payslip_profile'
+
+# Crons que se reparten la cola de bloques: uno por worker del cron a ocupar
+CHUNK_CRON_XMLIDS = (
+    'kc_payroll_full.ir_cron_compute_payslip_chunks',
+    'kc_payroll_full.ir_cron_compute_payslip_chunks_2',
+    'kc_payroll_full.ir_cron_compute_payslip_chunks_3',
+    'kc_payroll_full.ir_cron_compute_payslip_chunks_4',
+)
+
+
+class HrPayslipRun(models.Model):
+    _inherit = 'hr.payslip.run'
+
+    sheet_chunk_ids = fields.One2many('hr.payslip.run.chunk', 'run_id',
+                                      string='Bloques de cálculo')
+    sheet_progress = fields.Float(string='Progreso de cálculo',
+                                  compute='_compute_sheet_progress')
+    sheet_error_count = fields.Integer(string='Bloques con error',
+                                       compute='_compute_sheet_progress')
+    sheet_running = fields.Boolean(string='Cálculo en proceso',
+                                   compute='_compute_sheet_progress')
+
+    profile_slip_count = fields.Integer(string='Nóminas medidas', readonly=True)
+    profile_attendance_ms = fields.Float(string='Asistencias (ms)', readonly=True)
+    profile_aggregation_ms = fields.Float(string='Agregación (ms)', readonly=True)
+    profile_work_entry_ms = fields.Float(string='Tipos de entrada (ms)', readonly=True)
+    profile_work_hours_ms = fields.Float(string='Horas de trabajo (ms)', readonly=True)
+    profile_avg_ms = fields.Float(string='Promedio por nómina (ms)',
+                                  compute='_compute_profile_avg_ms')
+
+    @api.depends('profile_slip_count', *[f'profile_{stage}_ms' for stage in PROFILE_STAGES])
+    def _compute_profile_avg_ms(self):
+        for run in self:
+            total = sum(run[f'profile_{stage}_ms'] for stage in PROFILE_STAGES)
+            run.profile_avg_ms = total / run.profile_slip_count if run.profile_slip_count else 0.0
+
+    @api.depends('sheet_chunk_ids.state', 'sheet_chunk_ids.slip_count')
+    def _compute_sheet_progress(self):
+        for run in self:
+            chunks = run.sheet_chunk_ids
+            total = sum(chunks.mapped('slip_count'))
+            processed = sum(chunk.slip_count for chunk in chunks
+                            if chunk.state in ('done', 'failed'))
+            run.sheet_progress = 100.0 * processed / total if total else 0.0
+            run.sheet_error_count = len(chunks.filtered(lambda c: c.state == 'failed'))
+            run.sheet_running = any(chunk.state in ('pending', 'running') for chunk in chunks)
+
+    def action_compute_sheets_async(self):
+        """Dividir las nóminas del lote en bloques y calcularlas en segundo plano."""
+        chunks = self.env['hr.payslip.run.chunk']
+        for run in self:
+            run.sheet_chunk_ids.filtered(lambda c: c.state != 'running').unlink()
+            chunks |= run._enqueue_sheet_chunks(run.slip_ids)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Cálculo en Segundo Plano',
+                'message': f"{len(chunks)} bloques de nóminas en cola.",
+                'type': 'info',
+                'sticky': False,
+                'next': {'type': 'ir.actions.act_window_close'},
+            }
+        }
+
+    def _enqueue_sheet_chunks(self, slips):
+        """Encolar el cálculo de ``slips`` (nóminas del lote) en bloques.
+
+        :returns: los bloques creados.
+        """
+        self.ensure_one()
+        chunk_size = int(self.env['ir.config_parameter'].sudo().get_param(
+            'kc_payroll_full.payslip_chunk_size', 100))
+        slips = slips.filtered(lambda s: s.state in ('draft', 'verify'))
+        chunks = self.env['hr.payslip.run.chunk'].create([
+            {'run_id': self.id, 'slip_ids': [Command.set(ids)]}
+            for ids in split_every(chunk_size, slips.ids)
+        ])
+        chunks._trigger_workers(len(chunks))
+        return chunks
+
+    def action_reset_profile(self):
+        """Poner a cero los tiempos acumulados del lote."""
+        self.write(dict.fromkeys(
+            ['profile_slip_count'] + [f'profile_{stage}_ms' for stage in PROFILE_STAGES], 0))
+
+    @api.model
+    def _flush_profile(self):
+        """Sumar a cada lote los tiempos registrados en la transacción."""
+        for run_id, profile in self.env.cr.precommit.data.pop(PROFILE_KEY, {}).items():
+            self.env.cr.execute(f"""
+                UPDATE hr_payslip_run
+                   SET profile_slip_count = COALESCE(profile_slip_count, 0) + %s,
+                       {', '.join(f"profile_{stage}_ms = COALESCE(profile_{stage}_ms, 0) + %s"
+                                  for stage in PROFILE_STAGES)}
+                 WHERE id = %s
+            """, [profile['slips'], *[profile[stage] for stage in PROFILE_STAGES], run_id])
+        self.invalidate_model(
+            ['profile_slip_count'] + [f'profile_{stage}_ms' for stage in PROFILE_STAGES])
+
+    def action_retry_failed_chunks(self):
+        """Volver a encolar los bloques que terminaron con error."""
+        failed = self.sheet_chunk_ids.filtered(lambda c: c.state == 'failed')
+        failed.write({'state': 'pending', 'error': False})
+        failed._trigger_workers(len(failed))
+
+
+class HrPayslipRunChunk(models.Model):
+    _name = 'hr.payslip.run.chunk'
+    _description = 'Bloque de Cálculo de Nóminas'
+    _order = 'run_id, id'
+
+    run_id = fields.Many2one('hr.payslip.run', string='Lote de Nómina', required=True,
+                             ondelete='cascade', index=True)
+    slip_ids = fields.Many2many('hr.payslip', string='Nóminas')
+    slip_count = fields.Integer(string='Nóminas', compute='_compute_slip_count', store=True)
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('running', 'En proceso'),
+        ('done', 'Hecho'),
+        ('failed', 'Error'),
+    ], string='Estado', default='pending', required=True, index=True)
+    error = fields.Text(string='Error', readonly=True)
+    duration = fields.Float(string='Duración (s)', readonly=True)
+
+    @api.depends('slip_ids')
+    def _compute_slip_count(self):
+        for chunk in self:
+            chunk.slip_count = len(chunk.slip_ids)
+
+    @api.model
+    def _trigger_workers(self, chunk_count):
+        """Disparar tantos crons de ``CHUNK_CRON_XMLIDS`` como workers sean útiles.
+
+        Como máximo ``kc_payroll_full.payslip_workers`` (y uno por bloque). Cada
+        cron lo ejecuta un worker distinto del servidor, así que el paralelismo
+        real también está limitado por ``max_cron_threads``.
+        """
+        if not chunk_count:
+            return
+        workers = int(self.env['ir.config_parameter'].sudo().get_param(
+            'kc_payroll_full.payslip_workers', 4))
+        for xmlid in CHUNK_CRON_XMLIDS[:max(1, min(workers, chunk_count))]:
+            self.env.ref(xmlid)._trigger()
+
+    @api.model
+    def _cron_process_chunks(self):
+        """Procesar bloques pendientes hasta vaciar la cola.
+
+        Lo ejecutan los crons de ``CHUNK_CRON_XMLIDS``; cada uno corre en su
+        propio worker del cron y toma bloques con ``SKIP LOCKED``, así se
+        reparten la cola sin procesar dos veces el mismo bloque.
+        """
+        # Bloques abandonados por un worker caído vuelven a la cola
+        self.env.cr.execute("""
+            UPDATE hr_payslip_run_chunk SET state = 'pending'
+             WHERE state = 'running' AND write_date < NOW() AT TIME ZONE 'UTC' - INTERVAL '1 hour'
+        """)
+        self.env.cr.commit()
+        self._process_pending()
+
+    @api.model
+    def _process_pending(self):
+        """Tomar y procesar bloques pendientes hasta vaciar la cola."""
+        while True:
+            self.env.cr.execute("""
+                SELECT id FROM hr_payslip_run_chunk
+                 WHERE state = 'pending'
+                 ORDER BY id
+                 LIMIT 1
+                   FOR UPDATE SKIP LOCKED
+            """)
+            row = self.env.cr.fetchone()
+            if not row:
+                return
+            chunk = self.browse(row[0])
+            chunk.state = 'running'
+            self.env.cr.commit()
+            chunk._process()
+
+    def _process(self):
+        """Calcular las nóminas del bloque; un error solo afecta a este bloque."""
+        self.ensure_one()
+        start = time.monotonic()
+        try:
+            with self.env.cr.savepoint():
+                self.slip_ids.filtered(lambda s: s.state in ('draft', 'verify')).compute_sheet()
+            vals = {'state': 'done', 'error': False}
+        except Exception as e:
+            _logger.exception("Error calculando el bloque de nóminas %s", self.id)
+            # el bloque empieza tras un commit: todo lo acumulado es de las
+            # nóminas revertidas, que no se suman a los tiempos del lote
+            self.env.cr.precommit.data.pop(PROFILE_KEY, None)
+            vals = {'state': 'failed', 'error': str(e)}
+        vals['duration'] = time.monotonic() - start
+        self.write(vals)
+        self.env.cr.commit()
@@ -0,0 +1,48 @@
+from odoo import api, models, tools
+
+
+class HrWorkEntryType(models.Model):
+    _inherit = 'hr.work.entry.type'
+
+    @api.model
+    @tools.ormcache()
+    def _get_code_data(self):
+        """Tipos de entrada como ``({código: id}, {id: secuencia})``.
+
+        El mapa por código solo incluye tipos activos y, si hay códigos repetidos,
+        gana el primero según el orden del modelo, igual que
+        ``search([('code', '=', código)], limit=1)``.
+        """
+        ids_by_code, sequences = {}, {}
+        for entry_type in self.sudo().with_context(active_test=False).search_read(
+                [], ['code', 'sequence', 'active']):
+            sequences[entry_type['id']] = entry_type['sequence']
+            if entry_type['active'] and entry_type['code']:
+                ids_by_code.setdefault(entry_type['code'], entry_type['id'])
+        return ids_by_code, sequences
+
+    @api.model
+    def _get_by_code(self, code):
+        """Tipo de entrada activo con el código dado (recordset vacío si no existe)."""
+        return self.browse(self._get_code_data()[0].get(code))
+
+    @api.model
+    def _get_cached_sequence(self, entry_type_id):
+        return self._get_code_data()[1].get(entry_type_id, 0)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        entry_types = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return entry_types
+
+    def write(self, vals):
+        res = super().write(vals)
+        if {'code', 'sequence', 'active'} & set(vals):
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
@@ -0,0 +1,53 @@
+import hashlib
+import logging
+import os
+import shutil
+
+from odoo import api, models
+
+_logger = logging.getLogger(__name__)
+
+
+class IrAttachment(models.Model):
+    _inherit = 'ir.attachment'
+
+    @api.model
+    def _create_from_path(self, path, vals):
+        """Crear un adjunto a partir de un archivo en disco sin cargarlo en memoria.
+
+        Con almacenamiento en filestore el archivo se copia por bloques mientras
+        se calcula su checksum; con almacenamiento en base de datos se lee
+        entero, como en un ``create`` normal.
+
+        :param path: ruta del archivo ya escrito y cerrado.
+        :param vals: valores del adjunto (``name``, ``res_model``, ...).
+        """
+        if self._storage() != 'file':
+            with open(path, 'rb') as f:
+                return self.create(dict(vals, raw=f.read()))
+
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(block)
+        checksum = sha1.hexdigest()
+
+        # misma ruta que _get_path, sin su control de colisión contra b''
+        fname = checksum[:2] + '/' + checksum
+        full_path = self._full_path(fname)
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            try:
+                shutil.copyfile(path, full_path)
+                # por si la transacción se cancela
+                self._mark_for_gc(fname)
+            except OSError:
+                _logger.info("_create_from_path escribiendo %s", full_path, exc_info=True)
+                raise
+
+        return self.create(dict(
+            vals,
+            store_fname=fname,
+            checksum=checksum,
+            file_size=os.path.getsize(path),
+        ))
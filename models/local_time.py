@@ -0,0 +1,66 @@
+"""Conversión entre UTC y hora local con zonas horarias y transiciones en caché.
+
+Las zonas horarias y sus tablas de transiciones de desfase UTC se construyen una
+sola vez por nombre, de modo que convertir una marcación es una búsqueda binaria
+en lugar de una localización pytz.
+"""
+import bisect
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+import pytz
+
+DEFAULT_TZ = 'America/Tegucigalpa'
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name):
+    """Zona horaria pytz memoizada; si el nombre no es válido se usa ``DEFAULT_TZ``."""
+    try:
+        return pytz.timezone(name or DEFAULT_TZ)
+    except pytz.UnknownTimeZoneError:
+        return pytz.timezone(DEFAULT_TZ)
+
+
+@lru_cache(maxsize=None)
+def _transitions(name):
+    """Tabla ``(instantes, desfases)`` en segundos para la zona horaria.
+
+    ``desfases[i]`` rige desde ``instantes[i]`` (epoch UTC) hasta el siguiente.
+    """
+    tz = get_timezone(name)
+    utc_times = getattr(tz, '_utc_transition_times', None)
+    if not utc_times:
+        return (np.array([np.iinfo(np.int64).min], dtype=np.int64),
+                np.array([int(tz.utcoffset(_EPOCH).total_seconds())], dtype=np.int64))
+    instants = [int((moment - _EPOCH).total_seconds()) for moment in utc_times]
+    offsets = [int(info[0].total_seconds()) for info in tz._transition_info]
+    return np.array(instants, dtype=np.int64), np.array(offsets, dtype=np.int64)
+
+
+def utc_offset(name, epoch):
+    """Desfase UTC en segundos vigente en el instante ``epoch``."""
+    instants, offsets = _transitions(name)
+    return int(offsets[max(bisect.bisect_right(instants, epoch) - 1, 0)])
+
+
+def utc_offsets(name, epochs):
+    """Versión vectorizada de :func:`utc_offset` para un arreglo de epochs."""
+    instants, offsets = _transitions(name)
+    return offsets[np.maximum(np.searchsorted(instants, epochs, side='right') - 1, 0)]
+
+
+def to_local(value, name):
+    """Convertir un datetime (naive en UTC o con tzinfo) a hora local naive."""
+    if value.tzinfo:
+        value = value.astimezone(pytz.utc).replace(tzinfo=None)
+    epoch = int((value - _EPOCH).total_seconds())
+    return value + timedelta(seconds=utc_offset(name, epoch))
+
+
+def to_utc(value, name):
+    """Convertir una hora local naive a UTC naive."""
+    return get_timezone(name).localize(value).astimezone(pytz.utc).replace(tzinfo=None)
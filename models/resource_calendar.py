@@ -1,6 +1,83 @@
-from odoo import fields, models, api
+from odoo import api, fields, models, tools, _
+from odoo.exceptions import ValidationError
 
 
+HE_BUCKETS = [
+    ('sabado_acum', 'Acumulado Sábado'),
+    ('he25', 'HE 25%'),
+    ('he50', 'HE 50%'),
+    ('he75', 'HE 75%'),
+]
+
+DAYOFWEEK = [
+    ('0', 'Lunes'),
+    ('1', 'Martes'),
+    ('2', 'Miércoles'),
+    ('3', 'Jueves'),
+    ('4', 'Viernes'),
+    ('5', 'Sábado'),
+    ('6', 'Domingo'),
+]
+
+# Franjas predeterminadas por (horas del contrato, nocturna) para los calendarios
+# que no tienen franjas propias. Cada franja es
+# (día, hora_desde, hora_hasta, tipo, horas_mínimas, sin_horario); las horas
+# >= 24 corresponden al día siguiente.
+OVERTIME_BAND_PRESETS = {
+    # 60h DIURNO: HE25 desde las 15:00 (o tras 8h trabajadas); HE50 desde las
+    # 19:00 y HE75 desde las 00:00 sin esperar las 8h. Viernes HE25 desde las
+    # 14:00 y el sábado toda la jornada aunque el horario no tenga ese día.
+    (60, False): [
+        *[(day, 15.0, 19.0, 'he25', 8.0, False) for day in '01236'],
+        *[(day, 19.0, 24.0, 'he50', 0.0, False) for day in '01236'],
+        *[(day, 24.0, 29.0, 'he75', 0.0, False) for day in '01236'],
+        ('4', 14.0, 18.0, 'he25', 0.0, False),
+        ('4', 18.0, 24.0, 'he50', 0.0, False),
+        ('4', 24.0, 29.0, 'he75', 0.0, False),
+        ('5', 0.0, 48.0, 'he25', 0.0, True),
+    ],
+    # 60h NOCTURNO: 18:00-01:00 ordinarias, 01:00-06:00 HE75.
+    (60, True): [
+        (day, 25.0, 30.0, 'he75', 0.0, False) for day in '0123456'
+    ],
+    # 44h DIURNO: 07:30-15:30 ordinarias, 15:30-16:30 acumulado sábado,
+    # 16:30-19:00 HE25, 19:00-22:00 HE50, 22:00-06:00 HE75.
+    (44, False): [
+        (day, hour_from, hour_to, bucket, 0.0, False)
+        for day in '0123456'
+        for hour_from, hour_to, bucket in ((15.5, 16.5, 'sabado_acum'),
+                                           (16.5, 19.0, 'he25'),
+                                           (19.0, 22.0, 'he50'),
+                                           (22.0, 30.0, 'he75'))
+    ],
+}
+
+
+def compile_overtime_bands(bands):
+    """Compilar franjas a una tabla por día de la semana en minutos.
+
+    :param bands: iterable de (día, hora_desde, hora_hasta, tipo, horas_mínimas,
+        sin_horario).
+    :returns: dict ``{weekday: (sin_horario, franjas)}`` donde ``franjas`` es una
+        tupla ordenada por inicio de ``(inicio, fin, tipo, mínimo)`` en minutos
+        desde la medianoche local del día de entrada.
+    """
+    table = {}
+    for dayofweek, hour_from, hour_to, bucket, min_worked, without_schedule in bands:
+        day = table.setdefault(int(dayofweek), [False, []])
+        day[0] = day[0] or bool(without_schedule)
+        day[1].append((round(hour_from * 60), round(hour_to * 60), bucket,
+                       round((min_worked or 0.0) * 60)))
+    return {
+        weekday: (without_schedule, tuple(sorted(day_bands)))
+        for weekday, (without_schedule, day_bands) in table.items()
+    }
+
+
+COMPILED_OVERTIME_BAND_PRESETS = {
+    key: compile_overtime_bands(bands) for key, bands in OVERTIME_BAND_PRESETS.items()
+}
+
 
 class ResourceCalendar(models.Model):
     _inherit = 'resource.calendar'
@@ -13,4 +90,95 @@ class ResourceCalendar(models.Model):
     es_nomina_semanal = fields.Boolean(
         string='Nómina Semanal',
         help='Indica que este calendario se utiliza para nóminas semanales'
-    )
\ No newline at end of file
+    )
+
+    overtime_band_ids = fields.One2many(
+        'resource.calendar.overtime.band', 'calendar_id',
+        string='Franjas de Horas Extra', copy=True,
+        help='Si se deja vacío se usan las franjas predeterminadas según las horas '
+             'del contrato (60h diurno, 60h nocturno, 44h diurno).'
+    )
+
+    @tools.ormcache('self.id')
+    def _get_own_overtime_band_table(self):
+        return compile_overtime_bands(
+            (band.dayofweek, band.hour_from, band.hour_to, band.bucket,
+             band.min_worked_hours, band.apply_without_schedule)
+            for band in self.overtime_band_ids
+        )
+
+    def _get_overtime_band_table(self, full_req):
+        """Tabla compilada de franjas de horas extra para este calendario.
+
+        Usa las franjas propias del calendario y, si no tiene, las predeterminadas
+        para ``(full_req, nocturna)``. Devuelve ``{}`` si no aplica ninguna.
+        """
+        self.ensure_one()
+        return (self._get_own_overtime_band_table()
+                or COMPILED_OVERTIME_BAND_PRESETS.get((full_req, bool(self.nocturna)), {}))
+
+    def action_load_overtime_band_preset(self):
+        """Copiar las franjas predeterminadas al calendario para editarlas."""
+        for calendar in self:
+            preset = OVERTIME_BAND_PRESETS.get(
+                (calendar.full_time_required_hours, bool(calendar.nocturna)))
+            if not preset:
+                raise ValidationError(_(
+                    "No hay franjas predeterminadas para %(hours)sh %(mode)s.",
+                    hours=calendar.full_time_required_hours,
+                    mode='nocturno' if calendar.nocturna else 'diurno'))
+            calendar.overtime_band_ids = [(5, 0, 0)] + [
+                (0, 0, {
+                    'dayofweek': dayofweek,
+                    'hour_from': hour_from,
+                    'hour_to': hour_to,
+                    'bucket': bucket,
+                    'min_worked_hours': min_worked,
+                    'apply_without_schedule': without_schedule,
+                })
+                for dayofweek, hour_from, hour_to, bucket, min_worked, without_schedule in preset
+            ]
+
+
+class ResourceCalendarOvertimeBand(models.Model):
+    _name = 'resource.calendar.overtime.band'
+    _description = 'Franja de Horas Extra del Horario'
+    _order = 'calendar_id, dayofweek, hour_from'
+
+    calendar_id = fields.Many2one('resource.calendar', string='Horario', required=True,
+                                  ondelete='cascade', index=True)
+    dayofweek = fields.Selection(DAYOFWEEK, string='Día de la semana', required=True)
+    hour_from = fields.Float(string='Desde', required=True,
+                             help='Hora local. Valores de 24 o más corresponden al día siguiente.')
+    hour_to = fields.Float(string='Hasta', required=True,
+                           help='Hora local. Valores de 24 o más corresponden al día siguiente.')
+    bucket = fields.Selection(HE_BUCKETS, string='Tipo', required=True)
+    min_worked_hours = fields.Float(
+        string='Horas trabajadas mínimas',
+        help='La franja solo cuenta después de estas horas desde la entrada.')
+    apply_without_schedule = fields.Boolean(
+        string='Aplicar sin horario',
+        help='Aplicar la franja aunque el horario no tenga líneas de asistencia ese día.')
+
+    @api.constrains('hour_from', 'hour_to')
+    def _check_hours(self):
+        for band in self:
+            if not 0 <= band.hour_from < band.hour_to <= 48:
+                raise ValidationError(_(
+                    "La franja debe cumplir 0 <= Desde < Hasta <= 48."))
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        bands = super().create(vals_list)
+        self.env.registry.clear_cache()
+        return bands
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
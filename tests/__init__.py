@@ -0,0 +1,3 @@
+from . import test_attendance_import_pairing
+from . import test_overtime_new_records
+from . import test_overtime_band_presets
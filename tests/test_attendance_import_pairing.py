@@ -0,0 +1,132 @@
+from datetime import datetime
+
+from odoo.tests.common import BaseCase
+
+from odoo.addons.kc_payroll_full.wizard.hr_attendance_import_wizard import (
+    build_shift_spans, pair_punches,
+)
+
+# Lunes a viernes 8-12 y 13-17
+DAY_LINES = [(day, hour_from, hour_to) for day in range(5)
+             for hour_from, hour_to in ((8.0, 12.0), (13.0, 17.0))]
+
+# Lunes a viernes 18:00 a 06:00 del día siguiente
+NIGHT_LINES = [(day, 18.0, 6.0) for day in range(5)]
+
+# Jornada larga: lunes a viernes 06-12 y 13-18
+LONG_DAY_LINES = [(day, hour_from, hour_to) for day in range(5)
+                  for hour_from, hour_to in ((6.0, 12.0), (13.0, 18.0))]
+
+# 44h: lunes a jueves 07:30-12 y 13-17:30, viernes 07:30-12 y 13-16:30
+LINES_44H = [(day, hour_from, hour_to) for day in range(5)
+             for hour_from, hour_to in ((7.5, 12.0), (13.0, 16.5 if day == 4 else 17.5))]
+
+
+def dt(day, hour, minute=0):
+    # 2024-01-01 es lunes
+    return datetime(2024, 1, day, hour, minute)
+
+
+class TestAttendanceImportPairing(BaseCase):
+
+    def _pair(self, times, lines=DAY_LINES, nocturna=False):
+        return pair_punches(times, build_shift_spans(lines, nocturna=nocturna))
+
+    def test_build_shift_spans(self):
+        self.assertEqual(build_shift_spans(DAY_LINES)[0], (8 * 60, 17 * 60))
+        self.assertEqual(build_shift_spans(NIGHT_LINES, nocturna=True)[0], (18 * 60, 30 * 60))
+        # sin nocturna las líneas que terminan al día siguiente se ignoran
+        self.assertEqual(build_shift_spans(NIGHT_LINES), ())
+
+    def test_regular_days(self):
+        times = [dt(1, 7, 55), dt(1, 17, 5), dt(2, 8, 2), dt(2, 16, 58)]
+        pairs, orphans = self._pair(times)
+        self.assertEqual(pairs, [(times[0], times[1]), (times[2], times[3])])
+        self.assertEqual(orphans, [])
+
+    def test_lunch_split(self):
+        times = [dt(1, 8), dt(1, 12), dt(1, 13), dt(1, 17)]
+        pairs, orphans = self._pair(times)
+        self.assertEqual(pairs, [(times[0], times[1]), (times[2], times[3])])
+        self.assertEqual(orphans, [])
+
+    def test_missed_check_out(self):
+        times = [dt(1, 8), dt(2, 8), dt(2, 17)]
+        pairs, orphans = self._pair(times)
+        self.assertEqual(pairs, [(dt(2, 8), dt(2, 17))])
+        self.assertEqual(orphans, [dt(1, 8)])
+
+    def test_missed_check_in(self):
+        times = [dt(1, 17), dt(2, 8), dt(2, 17)]
+        pairs, orphans = self._pair(times)
+        self.assertEqual(pairs, [(dt(2, 8), dt(2, 17))])
+        self.assertEqual(orphans, [dt(1, 17)])
+
+    def test_unscheduled_saturday(self):
+        times = [dt(5, 8), dt(5, 17), dt(6, 9), dt(6, 14)]
+        pairs, orphans = self._pair(times)
+        self.assertEqual(pairs, [(dt(5, 8), dt(5, 17)), (dt(6, 9), dt(6, 14))])
+        self.assertEqual(orphans, [])
+
+    def test_night_shift(self):
+        lines = [(day, 22.0, 6.0) for day in range(5)]
+        times = [dt(1, 21, 50), dt(2, 6, 5), dt(2, 22), dt(3, 6)]
+        pairs, orphans = self._pair(times, lines, nocturna=True)
+        self.assertEqual(pairs, [(times[0], times[1]), (times[2], times[3])])
+        self.assertEqual(orphans, [])
+
+    def test_night_shift_missed_check_in(self):
+        # falta la entrada del lunes 18:00: la salida del martes 06:05 no debe
+        # tomarse como entrada ni desplazar los pares siguientes
+        times = [dt(1, 17, 55), dt(2, 6, 2), dt(2, 6, 5),
+                 dt(2, 17, 58), dt(3, 6, 1), dt(3, 18), dt(4, 6)]
+        pairs, orphans = self._pair(times, NIGHT_LINES, nocturna=True)
+        self.assertEqual(pairs, [
+            (dt(1, 17, 55), dt(2, 6, 2)),
+            (dt(2, 17, 58), dt(3, 6, 1)),
+            (dt(3, 18), dt(4, 6)),
+        ])
+        self.assertEqual(orphans, [dt(2, 6, 5)])
+
+    def test_night_shift_first_punch_is_check_out(self):
+        times = [dt(2, 6, 5), dt(2, 17, 58), dt(3, 6, 1)]
+        pairs, orphans = self._pair(times, NIGHT_LINES, nocturna=True)
+        self.assertEqual(pairs, [(dt(2, 17, 58), dt(3, 6, 1))])
+        self.assertEqual(orphans, [dt(2, 6, 5)])
+
+    def test_without_schedule(self):
+        times = [dt(1, 9), dt(1, 18), dt(3, 9), dt(3, 10)]
+        pairs, orphans = self._pair(times, [])
+        self.assertEqual(pairs, [(dt(1, 9), dt(1, 18)), (dt(3, 9), dt(3, 10))])
+        self.assertEqual(orphans, [])
+        # más de UNSCHEDULED_MAX_HOURS entre marcas: la primera queda sin pareja
+        pairs, orphans = self._pair([dt(1, 9), dt(2, 9)], [])
+        self.assertEqual(pairs, [])
+        self.assertEqual(orphans, [dt(1, 9), dt(2, 9)])
+
+    def test_overtime_night_after_long_day(self):
+        # salida pasada la medianoche, más cerca del inicio siguiente que del
+        # fin del turno: sigue siendo la salida de la jornada del lunes
+        times = [dt(1, 6), dt(2, 2), dt(2, 6), dt(2, 18)]
+        pairs, orphans = self._pair(times, LONG_DAY_LINES)
+        self.assertEqual(pairs, [(dt(1, 6), dt(2, 2)), (dt(2, 6), dt(2, 18))])
+        self.assertEqual(orphans, [])
+
+    def test_overtime_night_44h(self):
+        pairs, orphans = self._pair([dt(1, 7, 30), dt(2, 1)], LINES_44H)
+        self.assertEqual(pairs, [(dt(1, 7, 30), dt(2, 1))])
+        self.assertEqual(orphans, [])
+
+        times = [dt(1, 7, 30), dt(2, 1), dt(2, 7, 25), dt(2, 17, 40),
+                 dt(3, 7, 30), dt(3, 23, 15)]
+        pairs, orphans = self._pair(times, LINES_44H)
+        self.assertEqual(pairs, [(dt(1, 7, 30), dt(2, 1)), (dt(2, 7, 25), dt(2, 17, 40)),
+                                 (dt(3, 7, 30), dt(3, 23, 15))])
+        self.assertEqual(orphans, [])
+
+    def test_overtime_night_then_missed_check_out(self):
+        # jornada larga con horas extra y al día siguiente falta la salida
+        times = [dt(1, 6), dt(2, 1, 30), dt(2, 6), dt(3, 6), dt(3, 18)]
+        pairs, orphans = self._pair(times, LONG_DAY_LINES)
+        self.assertEqual(pairs, [(dt(1, 6), dt(2, 1, 30)), (dt(3, 6), dt(3, 18))])
+        self.assertEqual(orphans, [dt(2, 6)])
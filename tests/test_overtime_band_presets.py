@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from odoo.tests.common import TransactionCase
+
+from odoo.addons.kc_payroll_full.models.resource_calendar import (
+    COMPILED_OVERTIME_BAND_PRESETS,
+)
+
+# (entrada local, salida local, resultado del cálculo original por franjas fijas)
+BASELINE_60H_DAY = [
+    (datetime(2024, 1, 1, 6), datetime(2024, 1, 1, 21, 30),
+     {'he25': 4.0, 'he50': 2.5, 'he75': 0.0}),
+    (datetime(2024, 1, 1, 13), datetime(2024, 1, 1, 23),
+     {'he25': 0.0, 'he50': 4.0, 'he75': 0.0}),
+    (datetime(2024, 1, 1, 15, 45), datetime(2024, 1, 2, 0, 48),
+     {'he25': 0.0, 'he50': 5.0, 'he75': 0.8}),
+    (datetime(2024, 1, 2, 7), datetime(2024, 1, 3, 2),
+     {'he25': 4.0, 'he50': 5.0, 'he75': 2.0}),
+    (datetime(2024, 1, 3, 6), datetime(2024, 1, 3, 14),
+     {'he25': 0.0, 'he50': 0.0, 'he75': 0.0}),
+    (datetime(2024, 1, 4, 10), datetime(2024, 1, 4, 20),
+     {'he25': 1.0, 'he50': 1.0, 'he75': 0.0}),
+    # viernes
+    (datetime(2024, 1, 5, 6), datetime(2024, 1, 5, 20),
+     {'he25': 4.0, 'he50': 2.0, 'he75': 0.0}),
+    # sábado
+    (datetime(2024, 1, 6, 6), datetime(2024, 1, 6, 14, 30),
+     {'he25': 8.5, 'he50': 0.0, 'he75': 0.0}),
+]
+
+
+class TestOvertimeBandPresets(TransactionCase):
+
+    def test_60h_day_matches_baseline(self):
+        table = COMPILED_OVERTIME_BAND_PRESETS[(60, False)]
+        Attendance = self.env['hr.attendance']
+        for check_in, check_out, expected in BASELINE_60H_DAY:
+            with self.subTest(check_in=check_in, check_out=check_out):
+                _without_schedule, bands = table[check_in.weekday()]
+                values = Attendance._he_compute_values(check_in, check_out, bands)
+                self.assertEqual(
+                    {fname: values[fname] for fname in expected}, expected)
@@ -0,0 +1,32 @@
+from odoo.tests.common import TransactionCase
+
+
+class TestOvertimeNewRecords(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # sin contrato: la asistencia cae en el grupo sin cálculo (valores en cero)
+        employee = cls.env['hr.employee'].create({'name': 'Empleado HE', 'tz': 'UTC'})
+        cls.attendance = cls.env['hr.attendance'].create({
+            'employee_id': employee.id,
+            'check_in': '2024-01-01 08:00:00',
+            'check_out': '2024-01-01 20:00:00',
+        })
+        cls.env.cr.execute("""
+            UPDATE hr_attendance SET he25 = 1.5, he50 = 2.0, he75 = 0.5, sabado_acum = 1.0
+             WHERE id = %s
+        """, [cls.attendance.id])
+        cls.attendance.invalidate_recordset()
+
+    def test_onchange_does_not_write_origin(self):
+        new = self.env['hr.attendance'].new(
+            {'check_out': '2024-01-01 22:00:00'}, origin=self.attendance)
+        new._compute_he_franjas()
+        self.assertEqual(new.he25, 0.0)
+
+        self.env.flush_all()
+        self.attendance.invalidate_recordset()
+        self.assertRecordValues(self.attendance, [{
+            'he25': 1.5, 'he50': 2.0, 'he75': 0.5, 'sabado_acum': 1.0,
+        }])
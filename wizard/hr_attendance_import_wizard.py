@@ -1,45 +1,412 @@
+
 # models/hr_attendance_import_wizard.py
 
-import base64
-import io
+import binascii
+import csv
+import heapq
 import logging
+import os
+import tempfile
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
 from datetime import datetime, timedelta
+from itertools import groupby
+from operator import itemgetter
 
 import pytz
 from openpyxl import load_workbook
-from odoo import models, fields
+from odoo import api, models, fields
+from odoo.tools import split_every
 
 _logger = logging.getLogger(__name__)
 
+# Asistencias por llamada a create()
+CREATE_CHUNK_SIZE = 2000
+
+# Marcas ordenadas en memoria antes de volcarlas a un archivo temporal
+SORT_RUN_SIZE = 200000
+
+# Formato de ancho fijo de las marcas en los archivos temporales
+SPILL_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+CSV_EXTENSIONS = ('.csv', '.txt')
+
+# Conflictos y marcas sin pareja detallados en el resumen (el total se cuenta siempre)
+MAX_REPORTED_CONFLICTS = 200
+
+WEEK_MINUTES = 7 * 24 * 60
+
+# Líneas de horario separadas por menos de esto forman un mismo turno (almuerzo)
+SHIFT_MERGE_GAP = 240
+
+# Tiempo extra admitido después del fin del turno para aceptar una salida
+SHIFT_EXTRA_HOURS = 8
+
+# Duración máxima de una asistencia para empleados sin líneas de horario
+UNSCHEDULED_MAX_HOURS = 16
+
+# Días que se conservan las importaciones con error antes del vacuum
+FAILED_IMPORT_KEEP_DAYS = 7
+
+
+def build_shift_spans(lines, nocturna=False):
+    """Turnos de la semana a partir de las líneas de un horario.
+
+    Las líneas se pasan a minutos desde el lunes 00:00 y se unen cuando están
+    separadas por menos de ``SHIFT_MERGE_GAP`` minutos, así un horario con
+    almuerzo o un turno nocturno partido en medianoche (lun 22-24 + mar 0-6)
+    quedan como un solo turno. En horarios nocturnos una línea con
+    ``hour_to <= hour_from`` termina al día siguiente.
+
+    :param lines: iterable de ``(dayofweek, hour_from, hour_to)``.
+    :returns: tupla ordenada de ``(inicio, fin)`` en minutos; el fin puede pasar
+        de la semana si el turno cruza el domingo a medianoche.
+    """
+    intervals = []
+    for dayofweek, hour_from, hour_to in lines:
+        start = int(dayofweek) * 1440 + round(hour_from * 60)
+        end = int(dayofweek) * 1440 + round(hour_to * 60)
+        if end <= start:
+            if not nocturna:
+                continue
+            end += 1440
+        intervals.append((start, end))
+    intervals.sort()
+
+    spans = []
+    for start, end in intervals:
+        if spans and start <= spans[-1][1] + SHIFT_MERGE_GAP:
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([start, end])
+    # turno que sigue el domingo y termina el lunes de la semana siguiente
+    if len(spans) > 1 and spans[-1][1] + SHIFT_MERGE_GAP >= spans[0][0] + WEEK_MINUTES:
+        first = spans.pop(0)
+        spans[-1][1] = max(spans[-1][1], first[1] + WEEK_MINUTES)
+    return tuple((start, end) for start, end in spans)
+
+
+def pair_punches(times, spans):
+    """Emparejar las marcas ordenadas de un empleado en una sola pasada.
+
+    Para cada entrada abierta se toma como referencia el turno cuyo inicio está
+    más cerca; la marca siguiente se acepta como salida si no supera la
+    duración del turno más ``SHIFT_EXTRA_HOURS`` (o ``UNSCHEDULED_MAX_HOURS``
+    sin horario). Así una salida pasada la medianoche tras una jornada larga
+    (horas extra nocturnas) se empareja con su entrada. Solo si la marca que
+    le sigue también cabe en ese plazo se exige además que la salida esté más
+    cerca del fin del turno que del inicio del siguiente.
+
+    Si no, la entrada queda sin pareja y la marca pasa a ser la nueva entrada;
+    así una marca perdida no desplaza todos los pares siguientes. Una marca
+    que no puede ser entrada porque cae fuera de turno, poco después de un fin
+    de turno y más cerca de él que del inicio siguiente, queda sin pareja como
+    salida huérfana (entrada olvidada).
+
+    :param times: datetimes locales ordenados y sin duplicados.
+    :param spans: turnos de :func:`build_shift_spans`.
+    :returns: tupla ``(pares, marcas sin pareja)``.
+    """
+    starts = [start + week * WEEK_MINUTES for week in (-1, 0, 1) for start, _end in spans]
+    ends = [end + week * WEEK_MINUTES for week in (-1, 0, 1) for _start, end in spans]
+
+    pairs, orphans = [], []
+    check_in = None
+    for idx, punch in enumerate(times):
+        if check_in is not None:
+            following = times[idx + 1] if idx + 1 < len(times) else None
+            if _is_check_out(check_in, punch, following, starts, ends):
+                pairs.append((check_in, punch))
+                check_in = None
+                continue
+            orphans.append(check_in)
+            check_in = None
+        if _is_orphan_check_out(punch, starts, ends):
+            orphans.append(punch)
+        else:
+            check_in = punch
+    if check_in is not None:
+        orphans.append(check_in)
+    return pairs, orphans
+
+
+def _week_minute(moment):
+    """Minutos desde el lunes 00:00 de la semana de ``moment``."""
+    week_start = datetime.combine(moment.date() - timedelta(days=moment.weekday()),
+                                  datetime.min.time())
+    return (moment - week_start).total_seconds() / 60
+
+
+def _is_orphan_check_out(punch, starts, ends):
+    if not starts:
+        return False
+    minute = _week_minute(punch)
+    # último turno terminado antes de la marca
+    pos = bisect_right(ends, minute) - 1
+    if pos < 0:
+        return False
+    if pos + 1 < len(starts) and starts[pos + 1] <= minute:
+        return False  # dentro de un turno: puede ser una entrada tardía
+    since_end = minute - ends[pos]
+    if since_end > SHIFT_EXTRA_HOURS * 60:
+        return False
+    return pos + 1 == len(starts) or since_end < starts[pos + 1] - minute
+
+
+def _is_check_out(check_in, punch, following, starts, ends):
+    duration = (punch - check_in).total_seconds() / 60
+    if not starts:
+        return duration <= UNSCHEDULED_MAX_HOURS * 60
+
+    minute = _week_minute(check_in)
+    pos = bisect_right(starts, minute)
+    # turno de referencia: el de inicio más cercano a la entrada
+    if pos == len(starts) or (pos and minute - starts[pos - 1] <= starts[pos] - minute):
+        pos -= 1
+    shift_start, shift_end = starts[pos], ends[pos]
+    max_duration = shift_end - shift_start + SHIFT_EXTRA_HOURS * 60
+    if duration > max_duration:
+        return False
+    # única salida posible para esta entrada
+    if following is None or (following - check_in).total_seconds() / 60 > max_duration:
+        return True
+    if pos + 1 == len(starts):
+        return True
+    out_minute = minute + duration
+    return abs(out_minute - shift_end) <= abs(starts[pos + 1] - out_minute)
+
+
 class HrAttendanceImport(models.TransientModel):
     _name = "hr.attendance.import"
     _description = "Importar Asistencias desde Excel"
 
-    file_data = fields.Binary("Archivo Excel", required=True)
+    file_data = fields.Binary("Archivo Excel o CSV", required=True)
     file_name = fields.Char("Nombre de archivo")
 
+    async_mode = fields.Boolean("Procesar en segundo plano",
+                                help="Importar con un cron por bloques confirmados, "
+                                     "para archivos que superan el tiempo límite de la petición.")
+    state = fields.Selection([
+        ('draft', 'Borrador'),
+        ('queued', 'En cola'),
+        ('running', 'Importando'),
+        ('done', 'Importado'),
+        ('failed', 'Error'),
+    ], default='draft', readonly=True)
+    rows_total = fields.Integer("Marcas leídas", readonly=True)
+    rows_processed = fields.Integer("Marcas procesadas", readonly=True)
+    progress = fields.Float("Progreso", readonly=True)
+    rows_per_second = fields.Float("Marcas por segundo", readonly=True)
+    error_count = fields.Integer("Incidencias", readonly=True,
+                                 help="Marcas sin pareja, de barcodes desconocidos y conflictos.")
+    job_error = fields.Text("Error", readonly=True)
+    attendance_count = fields.Integer("Asistencias creadas", readonly=True)
+    orphan_count = fields.Integer("Marcas sin pareja", readonly=True)
+    orphans = fields.Text("Detalle de marcas sin pareja", readonly=True)
+    unknown_punch_count = fields.Integer("Marcas de barcodes desconocidos", readonly=True)
+    unknown_barcodes = fields.Text("Barcodes desconocidos", readonly=True)
+    duplicate_count = fields.Integer("Asistencias ya existentes", readonly=True)
+    updated_count = fields.Integer("Asistencias actualizadas", readonly=True)
+    conflict_count = fields.Integer("Conflictos", readonly=True)
+    conflicts = fields.Text("Detalle de conflictos", readonly=True)
+
     def action_import(self):
         self.ensure_one()
-        # 1) Abrir el Excel
-        data = base64.b64decode(self.file_data)
-        wb = load_workbook(filename=io.BytesIO(data), data_only=True)
-        sheet = wb.active
+        if self.async_mode:
+            # el archivo ya está guardado como adjunto del campo file_data
+            self.write({'state': 'queued'})
+            self.env.ref('kc_payroll_full.ir_cron_attendance_import')._trigger()
+        else:
+            self._run_import()
+        return self._action_reopen()
+
+    def action_refresh(self):
+        return self._action_reopen()
+
+    def _action_reopen(self):
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def _run_import(self, commit=False):
+        """Importar el archivo y dejar el resumen en el wizard.
+
+        :param commit: confirmar la transacción después de cada bloque creado
+            (modo en segundo plano). Los bloques confirmados quedan marcados
+            para el cron de recálculo de horas extra, así que tras una caída sus
+            horas extra se completan igual; un reintento detecta lo ya
+            confirmado como existente y lo omite.
+        """
+        stats = {
+            'barcodes': set(), 'unknown': defaultdict(int), 'orphans': 0, 'orphan_details': [],
+            'duplicates': 0, 'updates': {}, 'conflicts': [], 'conflict_count': 0,
+            'rows': 0, 'processed': 0, 'start': time.monotonic(),
+        }
+
+        def on_chunk(created):
+            self.write(dict(self._get_progress_values(stats), attendance_count=created))
+            if commit:
+                self.env.cr.commit()
+
+        with self._open_file() as path:
+            # 1) Leer las marcas (barcode, tiempo) fila por fila
+            punches = self._read_punches(path, stats)
+
+            # 2) Ordenar por empleado y hora con memoria acotada
+            punches = self._sort_punches(punches)
+
+            # 3) Emparejar entradas y salidas de cada empleado
+            vals = self._pair_punches(punches, stats)
+
+            # 4) Descartar lo ya importado; las salidas corregidas se actualizan
+            vals = self._filter_existing(vals, stats)
+
+            # 5) Crear en bloques y calcular las horas extra una sola vez al final
+            attendances = self._create_attendances(vals, on_chunk=on_chunk)
+            updated = self._apply_updates(stats['updates'])
+            self._recompute_imported(attendances | updated)
+
+        # 6) mostrar el resumen en el wizard
+        unknown = stats['unknown']
+        self.write(dict(
+            self._get_progress_values(stats),
+            state='done',
+            progress=100.0,
+            attendance_count=len(attendances),
+            orphan_count=stats['orphans'],
+            orphans="\n".join(stats['orphan_details']),
+            unknown_punch_count=sum(unknown.values()),
+            unknown_barcodes="\n".join(
+                f"{barcode}: {count} marcas" for barcode, count in sorted(unknown.items())),
+            duplicate_count=stats['duplicates'],
+            updated_count=len(updated),
+            conflict_count=stats['conflict_count'],
+            conflicts="\n".join(stats['conflicts']),
+        ))
+
+    def _get_progress_values(self, stats):
+        elapsed = time.monotonic() - stats['start']
+        return {
+            'rows_total': stats['rows'],
+            'rows_processed': stats['processed'],
+            'progress': 100.0 * stats['processed'] / stats['rows'] if stats['rows'] else 0.0,
+            'rows_per_second': stats['processed'] / elapsed if elapsed else 0.0,
+            'error_count': (stats['orphans'] + stats['conflict_count']
+                            + sum(stats['unknown'].values())),
+        }
+
+    @api.model
+    def _cron_process_imports(self):
+        """Procesar las importaciones en cola, una a la vez y por bloques confirmados."""
+        # Importaciones abandonadas por un worker caído vuelven a la cola
+        self.env.cr.execute("""
+            UPDATE hr_attendance_import SET state = 'queued'
+             WHERE state = 'running' AND write_date < NOW() AT TIME ZONE 'UTC' - INTERVAL '1 hour'
+        """)
+        self.env.cr.commit()
+        while True:
+            self.env.cr.execute("""
+                SELECT id FROM hr_attendance_import
+                 WHERE state = 'queued'
+                 ORDER BY id
+                 LIMIT 1
+                   FOR UPDATE SKIP LOCKED
+            """)
+            row = self.env.cr.fetchone()
+            if not row:
+                return
+            wizard = self.browse(row[0])
+            wizard.write({'state': 'running', 'job_error': False})
+            self.env.cr.commit()
+            # como el usuario que subió el archivo (zona horaria y permisos)
+            wizard.with_user(wizard.create_uid)._process_queued()
+
+    def _process_queued(self):
+        self.ensure_one()
+        try:
+            self._run_import(commit=True)
+        except Exception as e:
+            self.env.cr.rollback()
+            _logger.exception("Error importando asistencias (wizard %s)", self.id)
+            self.write({'state': 'failed', 'job_error': str(e)})
+            # horas extra de los bloques ya confirmados
+            self.env.ref('kc_payroll_full.ir_cron_recompute_he')._trigger()
+        self.env.cr.commit()
+
+    def _transient_clean_rows_older_than(self, seconds):
+        """Vacuum de los wizards sin borrar las importaciones pendientes.
+
+        Las importaciones en cola o en curso (y su archivo) no se borran; las
+        que terminaron con error se conservan ``FAILED_IMPORT_KEEP_DAYS`` días
+        para poder consultar el error.
+        """
+        # como el estándar, nunca lo usado en los últimos 5 minutos
+        seconds = max(seconds, 300)
+        self.env.cr.execute("""
+            SELECT id FROM hr_attendance_import
+             WHERE COALESCE(write_date, create_date, NOW() AT TIME ZONE 'UTC')
+                   < NOW() AT TIME ZONE 'UTC' - %s * INTERVAL '1 second'
+               AND (state IN ('draft', 'done')
+                    OR (state = 'failed'
+                        AND write_date < NOW() AT TIME ZONE 'UTC' - %s * INTERVAL '1 day'))
+        """, [seconds, FAILED_IMPORT_KEEP_DAYS])
+        self.sudo().browse([row[0] for row in self.env.cr.fetchall()]).unlink()
+
+    @contextmanager
+    def _open_file(self):
+        """Ruta en disco del archivo subido, sin cargarlo entero en memoria.
+
+        Si el adjunto del campo está en el filestore se usa directamente; si no,
+        se decodifica el base64 por partes a un archivo temporal.
+        """
+        attachment = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', '=', self.id),
+            ('res_field', '=', 'file_data'),
+        ], limit=1)
+        if attachment.store_fname:
+            yield attachment._full_path(attachment.store_fname)
+            return
+
+        suffix = os.path.splitext(self.file_name or '')[1]
+        with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+            if attachment:
+                tmp.write(attachment.raw)
+            else:
+                data = self.with_context(bin_size=False).file_data or b''
+                # bloques múltiplos de 4 caracteres base64
+                for start in range(0, len(data), 4 << 20):
+                    tmp.write(binascii.a2b_base64(data[start:start + (4 << 20)]))
+            tmp.flush()
+            yield tmp.name
+
+    def _read_punches(self, path, stats):
+        """Generar ``(barcode, tiempo local)`` por cada fila válida del archivo.
 
-        # 2) Parámetros de columnas
+        Al terminar, ``stats`` tiene los barcodes leídos (``barcodes``) y el
+        rango de marcas del archivo (``date_from`` y ``date_to``).
+        """
+        # Parámetros de columnas
         IDX_TIEMPO = 0  # Columna A
         IDX_ID     = 6  # Columna G (ID/barcode)
 
-        # 3) Timezone del usuario
-        user_tz = self.env.user.tz or self.env.context.get('tz') or 'UTC'
-        local_tz = pytz.timezone(user_tz)
-        utc_tz   = pytz.utc
+        if (self.file_name or '').lower().endswith(CSV_EXTENSIONS):
+            rows = self._iter_csv_rows(path)
+        else:
+            rows = self._iter_xlsx_rows(path)
 
-        # 4) Recolectar todos los timestamps por empleado (barcode)
-        attend_list = {}
-        for idx, row in enumerate(sheet.iter_rows(values_only=True), start=1):
-            if idx == 1:
-                continue  # salto encabezado
-            raw   = row[IDX_TIEMPO]
+        barcodes = stats['barcodes']
+        date_from = date_to = None
+        for idx, row in enumerate(rows, start=1):
+            if idx == 1 or len(row) <= IDX_ID:
+                continue  # salto encabezado y filas cortas
+            raw    = row[IDX_TIEMPO]
             emp_id = row[IDX_ID]
             if not raw or not emp_id:
                 continue
@@ -47,60 +414,282 @@ class HrAttendanceImport(models.TransientModel):
             # parseo a datetime
             if isinstance(raw, str):
                 try:
-                    tiempo = datetime.fromisoformat(raw)
+                    tiempo = datetime.fromisoformat(raw.strip())
                 except ValueError:
-                    tiempo = fields.Datetime.from_string(raw)
+                    tiempo = fields.Datetime.from_string(raw.strip())
             else:
                 tiempo = raw  # openpyxl ya lo entrega como datetime
 
             barcode = str(emp_id).strip()
-            attend_list.setdefault(barcode, []).append(tiempo)
-
-        # 5) Para cada empleado, emparejar timestamps en (check_in, check_out)
-        for barcode, times in attend_list.items():
-            # 5.1) ordenar
-            times_sorted = sorted(times)
-
-            # 5.2) filtrar duplicados dentro de 10 segundos
-            umbral = timedelta(seconds=10)
-            filtered = []
-            for t in times_sorted:
-                if not filtered or (t - filtered[-1]) > umbral:
-                    filtered.append(t)
-            times_sorted = filtered
-
-            emp = self.env["hr.employee"].search([("barcode", "=", barcode)], limit=1)
-            if not emp:
-                _logger.warning("Empleado no encontrado para barcode %s", barcode)
-                continue
+            barcodes.add(barcode)
+            stats['rows'] += 1
+            if date_from is None or tiempo < date_from:
+                date_from = tiempo
+            if date_to is None or tiempo > date_to:
+                date_to = tiempo
+            yield barcode, tiempo
+        stats['date_from'], stats['date_to'] = date_from, date_to
 
-            calendar = emp.resource_calendar_id
+    def _iter_xlsx_rows(self, path):
+        # read_only: openpyxl recorre la hoja sin cargarla entera. Se pasa el
+        # archivo abierto porque la ruta del filestore no tiene extensión y
+        # openpyxl rechaza los nombres que no terminan en .xlsx
+        with open(path, 'rb') as f:
+            wb = load_workbook(f, read_only=True, data_only=True)
+            try:
+                yield from wb.active.iter_rows(values_only=True)
+            finally:
+                wb.close()
 
-            # 5.3) iterar en pares: entrada → salida
-            for i in range(0, len(times_sorted), 2):
-                t_in_local = times_sorted[i]
-                if i + 1 < len(times_sorted):
-                    t_out_local = times_sorted[i + 1]
-                else:
-                    _logger.warning("Marca de salida faltante para %s @ %s", barcode, t_in_local)
-                    continue
+    def _iter_csv_rows(self, path):
+        with open(path, newline='', encoding='utf-8-sig', errors='replace') as f:
+            sample = f.read(64 * 1024)
+            f.seek(0)
+            try:
+                dialect = csv.Sniffer().sniff(sample, delimiters=',;\t|')
+            except csv.Error:
+                dialect = csv.excel
+            yield from csv.reader(f, dialect)
+
+    def _sort_punches(self, punches):
+        """Ordenar las marcas por (barcode, tiempo) con memoria acotada.
+
+        Se ordenan tramos de ``SORT_RUN_SIZE`` marcas en memoria; si el archivo
+        tiene más, cada tramo se vuelca a un archivo temporal y se mezclan con
+        ``heapq.merge`` (ordenación externa).
+        """
+        with ExitStack() as stack:
+            spills = []
+            run = []
+            for chunk in split_every(SORT_RUN_SIZE, punches, list):
+                chunk.sort()
+                if run:
+                    spills.append(self._spill_run(run, stack))
+                run = chunk
+            if not spills:
+                yield from run
+                return
+            spills.append(self._spill_run(run, stack))
+            yield from heapq.merge(*(self._read_run(spill) for spill in spills))
+
+    def _spill_run(self, run, stack):
+        spill = stack.enter_context(tempfile.TemporaryFile(mode='w+', encoding='utf-8'))
+        spill.writelines(f"{barcode}\t{tiempo.strftime(SPILL_FORMAT)}\n"
+                         for barcode, tiempo in run)
+        return spill
+
+    def _read_run(self, spill):
+        spill.seek(0)
+        for line in spill:
+            barcode, tiempo = line.rstrip('\n').split('\t')
+            yield barcode, datetime.strptime(tiempo, SPILL_FORMAT)
+
+    def _pair_punches(self, punches, stats):
+        """Generar los valores de asistencia a partir de las marcas ordenadas.
+
+        :param punches: iterable de ``(barcode, tiempo local)`` ordenado por
+            barcode y tiempo; solo se mantienen en memoria las marcas de un
+            empleado a la vez.
+        :param stats: dict del resumen de la importación; se actualizan
+            ``unknown`` (marcas por barcode desconocido), ``orphans`` y
+            ``orphan_details``.
+        """
+        # Timezone del usuario
+        user_tz = self.env.user.tz or self.env.context.get('tz') or 'UTC'
+        local_tz = pytz.timezone(user_tz)
+        utc_tz   = pytz.utc
+
+        umbral = timedelta(seconds=10)
+        index = None
+        spans = {}
+        for barcode, group in groupby(punches, key=itemgetter(0)):
+            if index is None:
+                # la ordenación ya consumió el archivo: se conocen todos los barcodes
+                index = stats['index'] = self._get_employee_index(stats['barcodes'])
+                line_values = self._get_calendar_lines(
+                    {values[1] for values in index.values() if values[1]})
 
-                # 5.4) turno nocturno: si la salida ≤ entrada, agrego un día
-                if calendar.nocturna and t_out_local <= t_in_local:
-                    t_out_local += timedelta(days=1)
+            # filtrar duplicados dentro de 10 segundos
+            times_sorted = []
+            for _barcode, t in group:
+                stats['processed'] += 1
+                if not times_sorted or (t - times_sorted[-1]) > umbral:
+                    times_sorted.append(t)
 
-                # 5.5) convertir de local a UTC
+            if barcode not in index:
+                stats['unknown'][barcode] = len(times_sorted)
+                continue
+
+            employee_id, calendar_id, nocturna = index[barcode]
+            if (calendar_id, nocturna) not in spans:
+                spans[calendar_id, nocturna] = build_shift_spans(
+                    line_values.get(calendar_id, ()), nocturna)
+
+            # emparejar según los turnos del horario (cruzan medianoche si aplica)
+            pairs, orphans = pair_punches(times_sorted, spans[calendar_id, nocturna])
+            stats['orphans'] += len(orphans)
+            for orphan in orphans:
+                _logger.debug("Marca sin pareja para %s @ %s", barcode, orphan)
+                if len(stats['orphan_details']) < MAX_REPORTED_CONFLICTS:
+                    stats['orphan_details'].append(f"{barcode}: {orphan}")
+
+            for t_in_local, t_out_local in pairs:
+                # convertir de local a UTC
                 dt_in_utc  = local_tz.localize(t_in_local).astimezone(utc_tz)
                 dt_out_utc = local_tz.localize(t_out_local).astimezone(utc_tz)
 
-                _logger.info("Import asist: %s IN=%s OUT=%s", barcode, dt_in_utc, dt_out_utc)
+                _logger.debug("Import asist: %s IN=%s OUT=%s", barcode, dt_in_utc, dt_out_utc)
 
-                # 5.6) crear registro de asistencia
-                self.env["hr.attendance"].create({
-                    "employee_id": emp.id,
+                yield {
+                    "employee_id": employee_id,
                     "check_in":    dt_in_utc.strftime("%Y-%m-%d %H:%M:%S"),
                     "check_out":   dt_out_utc.strftime("%Y-%m-%d %H:%M:%S"),
-                })
+                }
+
+    def _get_employee_index(self, barcodes):
+        """Resolver los barcodes del archivo en una sola búsqueda.
+
+        :returns: dict ``{barcode: (employee_id, calendar_id, nocturna)}``; si un
+            barcode se repite (varias compañías) gana el primer empleado, como
+            en ``search(..., limit=1)``.
+        """
+        employees = self.env["hr.employee"].search_fetch(
+            [("barcode", "in", list(barcodes))], ["barcode", "resource_calendar_id"])
+        employees.resource_calendar_id.fetch(["nocturna"])
+        index = {}
+        for emp in employees:
+            calendar = emp.resource_calendar_id
+            index.setdefault(emp.barcode, (emp.id, calendar.id, calendar.nocturna))
+        return index
+
+    def _filter_existing(self, vals_list, stats):
+        """Generar solo los pares que no existen aún en la base de datos.
+
+        La huella de cada par es ``(empleado, entrada, salida)``:
+
+        * misma huella: ya importado, se omite (``duplicates``);
+        * misma entrada con otra salida: se corrige la salida (``updates``);
+        * se solapa con otra asistencia del empleado: conflicto, se omite y se
+          reporta en lugar de abortar toda la importación con el error de
+          solapamiento de Odoo.
+        """
+        existing = None
+        for vals in vals_list:
+            if existing is None:
+                # el emparejamiento ya resolvió los empleados y el rango del archivo
+                existing = self._get_existing_attendances(stats)
+            employee_id = vals["employee_id"]
+            check_in, check_out = vals["check_in"], vals["check_out"]
+            starts, rows = existing.get(employee_id, ((), ()))
+            pos = bisect_right(starts, check_in)
+            previous = rows[pos - 1] if pos else None
+            following = rows[pos] if pos < len(rows) else None
+            overlaps_next = following is not None and following[1] < check_out
+
+            if previous and previous[1] == check_in:
+                if previous[2] == check_out:
+                    stats['duplicates'] += 1
+                elif overlaps_next:
+                    self._add_conflict(stats, vals, following[0])
+                else:
+                    stats['updates'][previous[0]] = check_out
+            elif previous and (previous[2] is None or previous[2] > check_in):
+                self._add_conflict(stats, vals, previous[0])
+            elif overlaps_next:
+                self._add_conflict(stats, vals, following[0])
+            else:
+                yield vals
+
+    def _get_existing_attendances(self, stats):
+        """Asistencias de los empleados del archivo en su rango de fechas.
+
+        Una sola consulta sobre el índice ``(employee_id, check_in)``.
+
+        :returns: dict ``{employee_id: (entradas, filas)}`` con las entradas
+            ordenadas (para ``bisect``) y las filas ``(id, entrada, salida)``
+            en el mismo orden; las fechas en formato de ``fields.Datetime``.
+        """
+        employee_ids = sorted({values[0] for values in stats.get('index', {}).values()})
+        if not employee_ids or stats.get('date_from') is None:
+            return {}
+        Attendance = self.env["hr.attendance"]
+        Attendance.flush_model(["employee_id", "check_in", "check_out"])
+        # margen de un día por la diferencia entre hora local y UTC
+        self.env.cr.execute("""
+            SELECT employee_id, id, check_in, check_out
+              FROM hr_attendance
+             WHERE employee_id = ANY(%s)
+               AND check_in >= %s
+               AND check_in < %s
+             ORDER BY employee_id, check_in
+        """, [employee_ids, stats['date_from'] - timedelta(days=1),
+              stats['date_to'] + timedelta(days=2)])
+        existing = {}
+        to_string = fields.Datetime.to_string
+        for employee_id, rows in groupby(self.env.cr.fetchall(), key=itemgetter(0)):
+            rows = [(att_id, to_string(check_in), to_string(check_out) if check_out else None)
+                    for _employee_id, att_id, check_in, check_out in rows]
+            existing[employee_id] = ([row[1] for row in rows], rows)
+        return existing
+
+    def _add_conflict(self, stats, vals, attendance_id):
+        stats['conflict_count'] += 1
+        if len(stats['conflicts']) < MAX_REPORTED_CONFLICTS:
+            stats['conflicts'].append(
+                f"Empleado {vals['employee_id']}: {vals['check_in']} - {vals['check_out']} "
+                f"se solapa con la asistencia {attendance_id}")
+
+    def _apply_updates(self, updates):
+        """Corregir la salida de asistencias existentes con la misma entrada."""
+        Attendance = self.env["hr.attendance"].with_context(he_defer_compute=True)
+        for attendance_id, check_out in updates.items():
+            Attendance.browse(attendance_id).write({"check_out": check_out})
+        return self.env["hr.attendance"].browse(list(updates))
+
+    def _get_calendar_lines(self, calendar_ids):
+        """Líneas de horario ``(dayofweek, hour_from, hour_to)`` por calendario."""
+        lines = self.env['resource.calendar.attendance'].search_read(
+            [('calendar_id', 'in', list(calendar_ids)), ('display_type', '=', False)],
+            ['calendar_id', 'dayofweek', 'hour_from', 'hour_to'])
+        line_values = defaultdict(list)
+        for line in lines:
+            line_values[line['calendar_id'][0]].append(
+                (line['dayofweek'], line['hour_from'], line['hour_to']))
+        return line_values
+
+    def _create_attendances(self, vals_list, on_chunk=None):
+        """Crear las asistencias en bloques de ``CREATE_CHUNK_SIZE``.
+
+        Las horas extra no se calculan al crear cada bloque (contexto
+        ``he_defer_compute``); cada bloque se crea marcado como pendiente de
+        recálculo, de modo que si la importación se interrumpe después de
+        confirmarlo el cron de recálculo lo completa. Ver
+        :meth:`_recompute_imported`.
+
+        :param vals_list: iterable de valores; se consume por bloques.
+        :param on_chunk: función llamada con el total creado tras cada bloque.
+        """
+        Attendance = self.env["hr.attendance"].with_context(he_defer_compute=True)
+        attendance_ids = []
+        for chunk in split_every(CREATE_CHUNK_SIZE, vals_list, list):
+            records = Attendance.create([dict(vals, he_recompute_pending=True)
+                                         for vals in chunk])
+            records.flush_recordset()
+            attendance_ids.extend(records.ids)
+            records.invalidate_recordset()
+            _logger.info("Import asist: %s asistencias creadas", len(attendance_ids))
+            if on_chunk:
+                on_chunk(len(attendance_ids))
+        return self.env["hr.attendance"].browse(attendance_ids)
+
+    def _recompute_imported(self, attendances):
+        """Calcular las horas extra de lo importado en una sola pasada.
 
-        # 6) cerrar wizard
-        return {"type": "ir.actions.act_window_close"}
+        Por encima del umbral de recálculo asíncrono se encolan para el cron.
+        """
+        threshold = int(self.env['ir.config_parameter'].sudo().get_param(
+            'kc_payroll_full.he_recompute_async_threshold', 5000))
+        if threshold and len(attendances) > threshold:
+            attendances._enqueue_he_recompute()
+        else:
+            attendances._recompute_he()
@@ -1,8 +1,19 @@
-
 import base64
-import pandas as pd
+import csv
+import io
+import logging
+import os
+import time
+
+from openpyxl import load_workbook
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+# Errores detallados en el reporte de validación (el total se cuenta siempre)
+MAX_REPORTED_ERRORS = 100
 
 class HrPayslipImportInput(models.TransientModel):
     _name = 'hr.payslip.import.input'
@@ -14,57 +25,229 @@ class HrPayslipImportInput(models.TransientModel):
     batch_id = fields.Many2one('hr.payslip.run', string="Lote de Planilla", required=True)
 
     def import_file(self):
-        # Decodifica el archivo y lo lee en un DataFrame de Pandas
+        # Lee el archivo fila por fila (CSV, XLSX en modo read_only o XLS con pandas)
+        start = time.perf_counter()
         try:
-            file_data = base64.b64decode(self.file)
-            df = pd.read_excel(file_data)
+            rows = self._read_rows()
+        except ValidationError:
+            raise
         except Exception as e:
             raise ValidationError("Error al leer el archivo: %s" % str(e))
+        parse_seconds = time.perf_counter() - start
+        _logger.info("Importar entradas: %s filas leídas en %.2fs", len(rows), parse_seconds)
+
+        # Búsquedas de todo el archivo, una consulta cada una
+        employees = self._get_employees_by_code({row[1] for row in rows if row[1]})
+        input_types = self._get_input_types_by_code({row[2] for row in rows if row[2]})
+        payslips = self._get_batch_payslips(set(employees.values()))
+
+        vals_list = self._check_rows(rows, employees, input_types, payslips)
+
+        # Crear todas las entradas de nómina en una sola llamada
+        inputs = self.env['hr.payslip.input'].create(vals_list)
+
+        # Calcular la hoja si está marcada la opción calcular_hoja
+        if self.calcular_hoja:
+            action = self._compute_payslips(inputs.payslip_id)
+        else:
+            action = {
+                'type': 'ir.actions.client',
+                'tag': 'reload',
+            }
+        return self._throughput_notification(len(rows), parse_seconds, action)
+
+    def _compute_payslips(self, payslips):
+        """Calcular una sola vez cada nómina afectada por la importación.
+
+        Por encima de ``kc_payroll_full.payslip_async_threshold`` nóminas se
+        encolan en los bloques de cálculo del lote; si no, se calculan aquí en
+        bloques de ``kc_payroll_full.payslip_chunk_size``.
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        threshold = int(params.get_param('kc_payroll_full.payslip_async_threshold', 200))
+        if threshold and len(payslips) > threshold:
+            chunks = self.batch_id._enqueue_sheet_chunks(payslips)
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': 'Cálculo en Segundo Plano',
+                    'message': f"Entradas importadas; {len(payslips)} nóminas en "
+                               f"{len(chunks)} bloques de cálculo en cola.",
+                    'type': 'info',
+                    'sticky': False,
+                    'next': {'type': 'ir.actions.client', 'tag': 'reload'},
+                }
+            }
+
+        chunk_size = int(params.get_param('kc_payroll_full.payslip_chunk_size', 100))
+        for ids in split_every(chunk_size, payslips.ids):
+            chunk = payslips.browse(ids)
+            chunk.compute_sheet()
+            chunk.invalidate_recordset()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'reload',
+        }
+
+    def _throughput_notification(self, row_count, parse_seconds, next_action):
+        if next_action.get('tag') == 'display_notification':
+            params = next_action['params']
+            params['message'] += f"\n{self._throughput_message(row_count, parse_seconds)}"
+            return next_action
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Entradas Importadas',
+                'message': self._throughput_message(row_count, parse_seconds),
+                'type': 'success',
+                'sticky': False,
+                'next': next_action,
+            }
+        }
+
+    def _throughput_message(self, row_count, parse_seconds):
+        rate = row_count / parse_seconds if parse_seconds else 0.0
+        return f"{row_count} filas leídas en {parse_seconds:.2f}s ({rate:.0f} filas/s)."
 
+    def _read_rows(self):
+        """Filas ``(fila, default_code, code, amount)`` del archivo, normalizadas.
+
+        ``fila`` es el número de fila en el archivo (1 = encabezado); los códigos
+        vacíos y los importes no numéricos quedan en ``None``.
+        """
+        extension = os.path.splitext(self.filename or '')[1].lower()
+        data = base64.b64decode(self.file)
+        if extension in ('.csv', '.txt'):
+            raw_rows = self._iter_csv(data)
+        elif extension == '.xls':
+            raw_rows = self._iter_xls(data)
+        else:
+            raw_rows = self._iter_xlsx(data)
+
+        header = next(raw_rows, None) or ()
+        columns = {str(name).strip(): index for index, name in enumerate(header)
+                   if name is not None}
         # Validación de columnas
         required_columns = ['default_code', 'code', 'amount']
-        if not all(column in df.columns for column in required_columns):
+        if not all(column in columns for column in required_columns):
             raise ValidationError(
                 "El archivo debe contener las columnas: 'default_code', 'code', y 'amount'.")
+        positions = [columns[column] for column in required_columns]
+        width = max(positions) + 1
 
-        for _, row in df.iterrows():
-            # Obtener el empleado usando 'default_code'
-            employee = self.env['hr.employee'].search(
-                [('registration_number', '=', row['default_code'])], limit=1)
-            if not employee:
-                raise ValidationError(
-                    f"Empleado con código {row['default_code']} no encontrado.")
-
-            # Obtener la regla salarial usando 'code'
-            rule = self.env['hr.payslip.input.type'].search([('code', '=', row['code'])],
-                                                     limit=1)
-            if not rule:
-                raise ValidationError(
-                    f"Regla salarial con código {row['code']} no encontrada.")
-
-            # Obtener la nómina del empleado en el lote seleccionado
-            payslip = self.env['hr.payslip'].search([
-                ('employee_id', '=', employee.id),
-                ('payslip_run_id', '=', self.batch_id.id),
-                ('state', '=', 'verify')
-            ], limit=1)
-
-            if not payslip:
-                raise ValidationError(
-                    f"No se encontró una nómina en borrador para el empleado {employee.name} en el lote seleccionado.")
-
-            # Crear la entrada de nómina en la nómina del empleado
-            self.env['hr.payslip.input'].create({
-                'payslip_id': payslip.id,
-                'input_type_id': rule.id,
-                'name': rule.name,
-                'amount': row['amount'],
-            })
-            # Calcular la hoja si está marcada la opción calcular_hoja
-            if self.calcular_hoja:
-                payslip.compute_sheet()
+        rows = []
+        for line, row in enumerate(raw_rows, start=2):
+            row = tuple(row) + (None,) * (width - len(row))
+            default_code, code, amount = (row[position] for position in positions)
+            if default_code in (None, '') and code in (None, '') and amount in (None, ''):
+                continue  # fila vacía
+            rows.append((line, self._normalize_code(default_code),
+                         self._normalize_code(code), self._normalize_amount(amount)))
+        return rows
 
-        return {
-            'type': 'ir.actions.client',
-            'tag': 'reload',
-        }
\ No newline at end of file
+    def _iter_csv(self, data):
+        text = data.decode('utf-8-sig', errors='replace')
+        try:
+            dialect = csv.Sniffer().sniff(text[:64 * 1024], delimiters=',;\t|')
+        except csv.Error:
+            dialect = csv.excel
+        return iter(csv.reader(io.StringIO(text), dialect))
+
+    def _iter_xlsx(self, data):
+        # read_only: openpyxl recorre la hoja sin cargarla entera
+        wb = load_workbook(filename=io.BytesIO(data), read_only=True, data_only=True)
+        try:
+            yield from wb.active.iter_rows(values_only=True)
+        finally:
+            wb.close()
+
+    def _iter_xls(self, data):
+        # Formato .xls antiguo: solo aquí se carga pandas (con xlrd)
+        import pandas as pd
+        df = pd.read_excel(io.BytesIO(data), header=None, dtype=object)
+        for row in df.itertuples(index=False, name=None):
+            yield tuple(None if pd.isna(value) else value for value in row)
+
+    @api.model
+    def _normalize_code(self, value):
+        """Código como texto; los numéricos de Excel (``123.0``) pierden el decimal."""
+        if value is None:
+            return None
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        value = str(value).strip()
+        return value or None
+
+    @api.model
+    def _normalize_amount(self, value):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        try:
+            return float(str(value).strip())
+        except (TypeError, ValueError):
+            return None
+
+    def _get_employees_by_code(self, codes):
+        """``{registration_number: employee_id}``; gana el primero, como ``limit=1``."""
+        employees = {}
+        for employee in self.env['hr.employee'].search_read(
+                [('registration_number', 'in', list(codes))], ['registration_number']):
+            employees.setdefault(employee['registration_number'], employee['id'])
+        return employees
+
+    def _get_input_types_by_code(self, codes):
+        """``{code: (input_type_id, name)}``; gana el primero, como ``limit=1``."""
+        input_types = {}
+        for input_type in self.env['hr.payslip.input.type'].search_read(
+                [('code', 'in', list(codes))], ['code', 'name']):
+            input_types.setdefault(input_type['code'], (input_type['id'], input_type['name']))
+        return input_types
+
+    def _get_batch_payslips(self, employee_ids):
+        """``{employee_id: payslip_id}`` de las nóminas por verificar del lote."""
+        payslips = {}
+        for payslip in self.env['hr.payslip'].search_read([
+            ('employee_id', 'in', list(employee_ids)),
+            ('payslip_run_id', '=', self.batch_id.id),
+            ('state', '=', 'verify'),
+        ], ['employee_id']):
+            payslips.setdefault(payslip['employee_id'][0], payslip['id'])
+        return payslips
+
+    def _check_rows(self, rows, employees, input_types, payslips):
+        """Validar todas las filas y reportar todos los errores juntos.
+
+        :returns: los valores de ``hr.payslip.input`` si no hay errores.
+        """
+        vals_list = []
+        errors = []
+        for line, default_code, code, amount in rows:
+            error_count = len(errors)
+            employee_id = employees.get(default_code)
+            input_type = input_types.get(code)
+            payslip_id = payslips.get(employee_id)
+            if not employee_id:
+                errors.append((line, f"Empleado con código {default_code} no encontrado."))
+            elif not payslip_id:
+                errors.append((line, f"No se encontró una nómina en borrador para el empleado "
+                                     f"{default_code} en el lote seleccionado."))
+            if not input_type:
+                errors.append((line, f"Regla salarial con código {code} no encontrada."))
+            if amount is None:
+                errors.append((line, "Importe vacío o no numérico."))
+            if len(errors) == error_count:
+                vals_list.append({
+                    'payslip_id': payslip_id,
+                    'input_type_id': input_type[0],
+                    'name': input_type[1],
+                    'amount': amount,
+                })
+        if not errors:
+            return vals_list
+        lines = [f"Fila {line}: {message}" for line, message in errors[:MAX_REPORTED_ERRORS]]
+        if len(errors) > len(lines):
+            lines.append(f"... y {len(errors) - len(lines)} errores más.")
+        raise ValidationError(
+            f"Se encontraron {len(errors)} errores en el archivo:\n" + "\n".join(lines))
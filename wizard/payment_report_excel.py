@@ -1,164 +1,308 @@
 from odoo import api, fields, models
+from odoo.exceptions import UserError
+from odoo.tools import config
 import base64
 import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 import xlsxwriter
 
-class WizardPayslipExcel(models.TransientModel):
-    _name = 'wizard.payslip.excel'
-    _description = 'Wizard para generar boletas de pago en Excel'
+from .payroll_excel_wizard import XLSX_MIMETYPE, sanitize_filename
 
-    file_data = fields.Binary('Archivo Excel')
-    file_name = fields.Char('Nombre del archivo', default='Boletas_de_Pago.xlsx')
+_logger = logging.getLogger(__name__)
 
-    payslip_run_id = fields.Many2one(
-        'hr.payslip.run',
-        string='Lote de Nómina',
-        required=True
-    )
+# Boletas por tarea enviada a cada proceso
+RECEIPT_TASK_SIZE = 50
+
+# Procesos de render por defecto y máximo, aunque el parámetro pida más
+RECEIPT_WORKERS = 2
+MAX_RECEIPT_WORKERS = 4
+
+INCOME_CATEGORIES = ('ALW', 'ING')
+DEDUCTION_CATEGORIES = ('DED',)
 
-    def action_generate_excel(self):
-        """ Genera el archivo Excel con el formato deseado para cada empleado. """
-        # 1. Crear un buffer para generar el Excel en memoria
-        output = io.BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
 
-        # Formatos
-        title_format = workbook.add_format({
+def add_receipt_formats(workbook):
+    """Formatos de celda de las boletas."""
+    return {
+        'title': workbook.add_format({
             'bold': True,
             'font_size': 14,
             'align': 'center'
-        })
-        header_format = workbook.add_format({
+        }),
+        'header': workbook.add_format({
             'bold': True,
             'align': 'center',
             'bg_color': '#D9D9D9'
-        })
-        normal_format = workbook.add_format({
+        }),
+        'normal': workbook.add_format({
             'align': 'left'
-        })
-        currency_format = workbook.add_format({
+        }),
+        'currency': workbook.add_format({
             'num_format': '#,##0.00',
             'align': 'right'
-        })
-        bold_format = workbook.add_format({
+        }),
+        'bold': workbook.add_format({
             'bold': True
-        })
+        }),
+    }
 
-        # 2. Obtener la información del lote de nómina y las nóminas asociadas
-        payslip_run = self.payslip_run_id
-        date_start = payslip_run.date_start
-        date_end = payslip_run.date_end
 
-        # Buscar todas las nóminas asociadas al Lote
-        payslips = self.env['hr.payslip'].search([
-            ('payslip_run_id', '=', payslip_run.id)
-        ])
+def set_receipt_columns(worksheet):
+    # Ajuste de ancho para mayor legibilidad (puedes personalizar)
+    worksheet.set_column('A:A', 30)
+    worksheet.set_column('B:B', 15)
+    worksheet.set_column('C:C', 15)
+    worksheet.set_column('D:D', 5)
+    worksheet.set_column('E:E', 30)
+    worksheet.set_column('F:F', 15)
+    worksheet.set_column('G:G', 15)
 
-        # 3. Crear la hoja principal en el Excel
-        worksheet = workbook.add_worksheet("Boletas de Pago")
-        # Ajuste de ancho para mayor legibilidad (puedes personalizar)
-        worksheet.set_column('A:A', 30)
-        worksheet.set_column('B:B', 15)
-        worksheet.set_column('C:C', 15)
-        worksheet.set_column('D:D', 5)
-        worksheet.set_column('E:E', 30)
-        worksheet.set_column('F:F', 15)
-        worksheet.set_column('G:G', 15)
-
-        # Variable para llevar el control de la fila en el Excel
-        row = 0
 
-        # Obtener el nombre de la empresa desde el lote (o desde otro modelo)
-        company = payslip_run.company_id
-        company_name = company.name or "Nombre de la Empresa"
-        if company.vat:
-            company_name = f"{company_name} - {company.vat}"
+def write_receipt(worksheet, row, header, receipt, formats):
+    """Escribir el bloque de un empleado a partir de ``row``.
 
-        # 4. Iterar sobre cada nómina (empleado) para generar su bloque de información
-        for payslip in payslips:
-            # ---------------------------------------------------------------
-            # Encabezado para cada empleado
-            # ---------------------------------------------------------------
-            worksheet.merge_range(row, 0, row, 6, company_name, title_format)
-            row += 1
+    Solo usa datos planos (ver ``WizardPayslipExcel._get_receipt_data``).
 
-            date_text = "Comprobante de Pago Salario del {} al {}".format(
-                date_start.strftime('%d-%m-%Y') if date_start else '',
-                date_end.strftime('%d-%m-%Y') if date_end else ''
-            )
-            worksheet.merge_range(row, 0, row, 6, date_text, normal_format)
-            row += 1
+    :returns: la fila siguiente al bloque.
+    """
+    normal_format = formats['normal']
+    currency_format = formats['currency']
+    bold_format = formats['bold']
 
-            worksheet.merge_range(row, 0, row, 6, "Empleado: " + payslip.employee_id.name, bold_format)
-            row += 1
+    # ---------------------------------------------------------------
+    # Encabezado para cada empleado
+    # ---------------------------------------------------------------
+    worksheet.merge_range(row, 0, row, 6, header['company_name'], formats['title'])
+    row += 1
 
-            # ---------------------------------------------------------------
-            # Información de días trabajados (una fila por cada línea)
-            if payslip.worked_days_line_ids:
-                for worked_day in payslip.worked_days_line_ids:
-                    worksheet.merge_range(row, 0, row, 2, worked_day.name, normal_format)
-                    worksheet.write(row, 3, worked_day.number_of_days, normal_format)
-                    row += 1
-            else:
-                worksheet.merge_range(row, 0, row, 2, "Sin datos de días trabajados", normal_format)
-                worksheet.write(row, 3, 0, normal_format)
-                row += 1
-
-            # ---------------------------------------------------------------
-            # Títulos de columnas para INGRESOS y EGRESOS
-            worksheet.merge_range(row, 0, row, 2, "INGRESOS", header_format)
-            worksheet.write(row, 3, "")
-            worksheet.merge_range(row, 4, row, 6, "EGRESOS", header_format)
-            row += 1
+    worksheet.merge_range(row, 0, row, 6, header['date_text'], normal_format)
+    row += 1
+
+    worksheet.merge_range(row, 0, row, 6, "Empleado: " + receipt['employee'], bold_format)
+    row += 1
 
-            # ---------------------------------------------------------------
-            # Detalle de las líneas (ingresos y deducciones) del empleado
-            ingreso_lines = payslip.line_ids.filtered(lambda l: l.category_id.code in ('ALW', 'ING'))
-            deduccion_lines = payslip.line_ids.filtered(lambda l: l.category_id.code == 'DED')
-            max_lines = max(len(ingreso_lines), len(deduccion_lines))
-
-            for i in range(max_lines):
-                if i < len(ingreso_lines):
-                    line_ingreso = ingreso_lines[i]
-                    worksheet.write(row, 0, line_ingreso.name, normal_format)
-                    worksheet.write_number(row, 1, line_ingreso.total, currency_format)
-                else:
-                    worksheet.write(row, 0, "", normal_format)
-                    worksheet.write(row, 1, 0, currency_format)
-
-                worksheet.write(row, 2, "", normal_format)
-
-                if i < len(deduccion_lines):
-                    line_deduccion = deduccion_lines[i]
-                    worksheet.write(row, 4, line_deduccion.name, normal_format)
-                    worksheet.write_number(row, 5, abs(line_deduccion.total), currency_format)
-                else:
-                    worksheet.write(row, 4, "", normal_format)
-                    worksheet.write(row, 5, 0, currency_format)
-
-                row += 1
-
-            total_ingresos = sum(ingreso_lines.mapped('total'))
-            total_egresos = sum(deduccion_lines.mapped('total'))
-            neto = total_ingresos + total_egresos
-
-            worksheet.write(row, 0, "Total Ingresos", bold_format)
-            worksheet.write_number(row, 1, total_ingresos, currency_format)
-            worksheet.write(row, 4, "Total Egresos", bold_format)
-            worksheet.write_number(row, 5, abs(total_egresos), currency_format)
+    # ---------------------------------------------------------------
+    # Información de días trabajados (una fila por cada línea)
+    if receipt['worked_days']:
+        for name, number_of_days in receipt['worked_days']:
+            worksheet.merge_range(row, 0, row, 2, name, normal_format)
+            worksheet.write(row, 3, number_of_days, normal_format)
             row += 1
+    else:
+        worksheet.merge_range(row, 0, row, 2, "Sin datos de días trabajados", normal_format)
+        worksheet.write(row, 3, 0, normal_format)
+        row += 1
+
+    # ---------------------------------------------------------------
+    # Títulos de columnas para INGRESOS y EGRESOS
+    worksheet.merge_range(row, 0, row, 2, "INGRESOS", formats['header'])
+    worksheet.write(row, 3, "")
+    worksheet.merge_range(row, 4, row, 6, "EGRESOS", formats['header'])
+    row += 1
+
+    # ---------------------------------------------------------------
+    # Detalle de las líneas (ingresos y deducciones) del empleado
+    ingreso_lines = receipt['incomes']
+    deduccion_lines = receipt['deductions']
+    max_lines = max(len(ingreso_lines), len(deduccion_lines))
+
+    for i in range(max_lines):
+        if i < len(ingreso_lines):
+            name, total = ingreso_lines[i]
+            worksheet.write(row, 0, name, normal_format)
+            worksheet.write_number(row, 1, total, currency_format)
+        else:
+            worksheet.write(row, 0, "", normal_format)
+            worksheet.write(row, 1, 0, currency_format)
+
+        worksheet.write(row, 2, "", normal_format)
+
+        if i < len(deduccion_lines):
+            name, total = deduccion_lines[i]
+            worksheet.write(row, 4, name, normal_format)
+            worksheet.write_number(row, 5, abs(total), currency_format)
+        else:
+            worksheet.write(row, 4, "", normal_format)
+            worksheet.write(row, 5, 0, currency_format)
+
+        row += 1
+
+    total_ingresos = sum(total for _name, total in ingreso_lines)
+    total_egresos = sum(total for _name, total in deduccion_lines)
+    neto = total_ingresos + total_egresos
+
+    worksheet.write(row, 0, "Total Ingresos", bold_format)
+    worksheet.write_number(row, 1, total_ingresos, currency_format)
+    worksheet.write(row, 4, "Total Egresos", bold_format)
+    worksheet.write_number(row, 5, abs(total_egresos), currency_format)
+    row += 1
+
+    worksheet.write(row, 0, "Total Neto", bold_format)
+    worksheet.write_number(row, 1, neto, currency_format)
+    worksheet.write(row, 4, "JEFE DE PRODUCCION", bold_format)
+    row += 2
+    return row
+
+
+def write_receipt_xlsx(path, header, receipt):
+    """Boleta de un empleado en su propio archivo Excel."""
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+    formats = add_receipt_formats(workbook)
+    worksheet = workbook.add_worksheet("Boleta de Pago")
+    set_receipt_columns(worksheet)
+    write_receipt(worksheet, 0, header, receipt, formats)
+    workbook.close()
+
 
-            worksheet.write(row, 0, "Total Neto", bold_format)
-            worksheet.write_number(row, 1, neto, currency_format)
-            worksheet.write(row, 4, "JEFE DE PRODUCCION", bold_format)
-            row += 2
+def write_receipt_pdf(path, header, receipt):
+    """Boleta de un empleado en PDF (reportlab), con el mismo contenido que en Excel."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    pdf = canvas.Canvas(path, pagesize=letter)
+    width, height = letter
+    left, middle, right = 40, width / 2 + 10, width - 40
+    y = height - 50
+
+    def amount(value):
+        return f"{value:,.2f}"
+
+    pdf.setFont('Helvetica-Bold', 14)
+    pdf.drawCentredString(width / 2, y, header['company_name'])
+    y -= 20
+    pdf.setFont('Helvetica', 10)
+    pdf.drawCentredString(width / 2, y, header['date_text'])
+    y -= 18
+    pdf.setFont('Helvetica-Bold', 10)
+    pdf.drawString(left, y, "Empleado: " + receipt['employee'])
+    y -= 18
+
+    pdf.setFont('Helvetica', 10)
+    for name, number_of_days in receipt['worked_days'] or [("Sin datos de días trabajados", 0)]:
+        pdf.drawString(left, y, name or '')
+        pdf.drawRightString(middle - 20, y, f"{number_of_days:g}")
+        y -= 14
+    y -= 6
+
+    pdf.setFont('Helvetica-Bold', 10)
+    pdf.drawString(left, y, "INGRESOS")
+    pdf.drawString(middle, y, "EGRESOS")
+    y -= 16
+    pdf.setFont('Helvetica', 10)
+    incomes, deductions = receipt['incomes'], receipt['deductions']
+    for i in range(max(len(incomes), len(deductions))):
+        if y < 60:
+            pdf.showPage()
+            pdf.setFont('Helvetica', 10)
+            y = height - 50
+        if i < len(incomes):
+            pdf.drawString(left, y, incomes[i][0] or '')
+            pdf.drawRightString(middle - 20, y, amount(incomes[i][1]))
+        if i < len(deductions):
+            pdf.drawString(middle, y, deductions[i][0] or '')
+            pdf.drawRightString(right, y, amount(abs(deductions[i][1])))
+        y -= 14
+
+    total_ingresos = sum(total for _name, total in incomes)
+    total_egresos = sum(total for _name, total in deductions)
+    y -= 6
+    pdf.setFont('Helvetica-Bold', 10)
+    pdf.drawString(left, y, "Total Ingresos")
+    pdf.drawRightString(middle - 20, y, amount(total_ingresos))
+    pdf.drawString(middle, y, "Total Egresos")
+    pdf.drawRightString(right, y, amount(abs(total_egresos)))
+    y -= 14
+    pdf.drawString(left, y, "Total Neto")
+    pdf.drawRightString(middle - 20, y, amount(total_ingresos + total_egresos))
+    pdf.drawString(middle, y, "JEFE DE PRODUCCION")
+    pdf.showPage()
+    pdf.save()
+
+
+RECEIPT_WRITERS = {
+    'xlsx': write_receipt_xlsx,
+    'pdf': write_receipt_pdf,
+}
+
+
+def render_receipts(directory, receipt_format, header, tasks):
+    """Escribir un grupo de boletas en ``directory``; se ejecuta en un proceso hijo.
+
+    Solo recibe datos planos, nunca registros ni cursores.
+
+    :param tasks: lista de ``(nombre de archivo, boleta)``.
+    :returns: los nombres de archivo escritos.
+    """
+    writer = RECEIPT_WRITERS[receipt_format]
+    for file_name, receipt in tasks:
+        writer(os.path.join(directory, file_name), header, receipt)
+    return [file_name for file_name, _receipt in tasks]
+
+
+class WizardPayslipExcel(models.TransientModel):
+    _name = 'wizard.payslip.excel'
+    _description = 'Wizard para generar boletas de pago en Excel'
+
+    file_data = fields.Binary('Archivo Excel')
+    file_name = fields.Char('Nombre del archivo', default='Boletas_de_Pago.xlsx')
+
+    payslip_run_id = fields.Many2one(
+        'hr.payslip.run',
+        string='Lote de Nómina',
+        required=True
+    )
+    stream_export = fields.Boolean(
+        'Modo para lotes grandes',
+        help='Escribe el Excel fila por fila a un archivo temporal (constant_memory) '
+             'y lo guarda como adjunto del lote, sin mantenerlo entero en memoria.')
+    split_per_employee = fields.Boolean(
+        'Un archivo por empleado',
+        help='Genera una boleta por empleado, en paralelo, y las entrega en un ZIP.')
+    receipt_format = fields.Selection([
+        ('xlsx', 'Excel'),
+        ('pdf', 'PDF'),
+    ], string='Formato de boletas', default='xlsx', required=True)
+
+    def action_generate_excel(self):
+        """ Genera el archivo Excel con el formato deseado para cada empleado. """
+        if self.split_per_employee:
+            return self._export_split_receipts()
+
+        file_name = "Boletas_de_Pago_{}.xlsx".format(fields.Date.today().strftime('%Y%m%d'))
+        if self.stream_export:
+            with tempfile.NamedTemporaryFile(suffix='.xlsx') as tmp:
+                workbook = xlsxwriter.Workbook(tmp.name, {'constant_memory': True})
+                self._write_workbook(workbook)
+                workbook.close()
+                attachment = self.env['ir.attachment']._create_from_path(tmp.name, {
+                    'name': file_name,
+                    'res_model': 'hr.payslip.run',
+                    'res_id': self.payslip_run_id.id,
+                    'mimetype': XLSX_MIMETYPE,
+                })
+            return {
+                'type': 'ir.actions.act_url',
+                'url': f'/web/content/{attachment.id}?download=true',
+                'target': 'self',
+            }
+
+        # 1. Crear un buffer para generar el Excel en memoria
+        output = io.BytesIO()
+        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+        self._write_workbook(workbook)
 
         workbook.close()
         file_data = output.getvalue()
         output.close()
 
         self.file_data = base64.b64encode(file_data)
-        self.file_name = "Boletas_de_Pago_{}.xlsx".format(fields.Date.today().strftime('%Y%m%d'))
+        self.file_name = file_name
 
         return {
             'type': 'ir.actions.act_url',
@@ -169,3 +313,158 @@ class WizardPayslipExcel(models.TransientModel):
             ),
             'target': 'self',
         }
+
+    def _write_workbook(self, workbook):
+        """Escribir las boletas del lote en ``workbook``, fila por fila en orden."""
+        formats = add_receipt_formats(workbook)
+
+        # 2. Obtener la información del lote de nómina y las nóminas asociadas
+        header = self._get_receipt_header()
+        receipts = self._get_receipt_data()
+
+        # 3. Crear la hoja principal en el Excel
+        worksheet = workbook.add_worksheet("Boletas de Pago")
+        set_receipt_columns(worksheet)
+
+        # 4. Iterar sobre cada nómina (empleado) para generar su bloque de información
+        row = 0
+        for receipt in receipts:
+            row = write_receipt(worksheet, row, header, receipt, formats)
+
+    def _export_split_receipts(self):
+        """Una boleta por empleado, renderizadas en paralelo y entregadas en un ZIP.
+
+        Los datos se leen antes de crear los procesos (``_get_receipt_data``);
+        los hijos, creados con ``fork``, solo escriben archivos en un directorio
+        temporal. Ver :meth:`_get_receipt_workers`.
+        """
+        if self.receipt_format == 'pdf':
+            try:
+                import reportlab  # noqa: F401
+            except ImportError:
+                raise UserError("Las boletas en PDF requieren la librería de Python 'reportlab'.")
+
+        header = self._get_receipt_header()
+        receipts = self._get_receipt_data()
+        extension = self.receipt_format
+        tasks = [
+            ("{:04d}_{}.{}".format(idx, sanitize_filename(receipt['employee']), extension), receipt)
+            for idx, receipt in enumerate(receipts, start=1)
+        ]
+        groups = [tasks[start:start + RECEIPT_TASK_SIZE]
+                  for start in range(0, len(tasks), RECEIPT_TASK_SIZE)]
+
+        workers = max(1, min(self._get_receipt_workers(), len(groups)))
+
+        zip_name = "Boletas_de_Pago_{}_{}.zip".format(
+            sanitize_filename(self.payslip_run_id.name), fields.Date.today().strftime('%Y%m%d'))
+        with tempfile.TemporaryDirectory() as directory:
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers,
+                                         mp_context=multiprocessing.get_context('fork')) as pool:
+                    futures = [pool.submit(render_receipts, directory, extension, header, group)
+                               for group in groups]
+                    file_names = [name for future in futures for name in future.result()]
+            else:
+                file_names = [name for group in groups
+                              for name in render_receipts(directory, extension, header, group)]
+            _logger.info("Boletas de pago: %s archivos generados con %s procesos",
+                         len(file_names), workers)
+
+            zip_path = os.path.join(directory, zip_name)
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for name in file_names:
+                    archive.write(os.path.join(directory, name), name)
+            attachment = self.env['ir.attachment']._create_from_path(zip_path, {
+                'name': zip_name,
+                'res_model': 'hr.payslip.run',
+                'res_id': self.payslip_run_id.id,
+                'mimetype': 'application/zip',
+            })
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{attachment.id}?download=true',
+            'target': 'self',
+        }
+
+    def _get_receipt_workers(self):
+        """Procesos para renderizar las boletas (1 = en este proceso).
+
+        ``kc_payroll_full.receipt_workers`` (por defecto ``RECEIPT_WORKERS``,
+        como máximo ``MAX_RECEIPT_WORKERS``). Solo se hace ``fork`` desde un
+        worker de un servidor multiproceso (``--workers``): en el servidor con
+        hilos el proceso copiaría los hilos de las demás peticiones a medio
+        ejecutar.
+        """
+        if not config['workers'] or threading.current_thread() is not threading.main_thread():
+            return 1
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            return 1
+        workers = int(self.env['ir.config_parameter'].sudo().get_param(
+            'kc_payroll_full.receipt_workers', RECEIPT_WORKERS))
+        return max(1, min(workers, MAX_RECEIPT_WORKERS))
+
+    def _get_receipt_header(self):
+        """Textos comunes a todas las boletas del lote."""
+        payslip_run = self.payslip_run_id
+        date_start = payslip_run.date_start
+        date_end = payslip_run.date_end
+
+        # Obtener el nombre de la empresa desde el lote (o desde otro modelo)
+        company = payslip_run.company_id
+        company_name = company.name or "Nombre de la Empresa"
+        if company.vat:
+            company_name = f"{company_name} - {company.vat}"
+
+        return {
+            'company_name': company_name,
+            'date_text': "Comprobante de Pago Salario del {} al {}".format(
+                date_start.strftime('%d-%m-%Y') if date_start else '',
+                date_end.strftime('%d-%m-%Y') if date_end else ''
+            ),
+        }
+
+    def _get_receipt_data(self):
+        """Datos de las boletas del lote como dicts, con unas pocas lecturas agrupadas.
+
+        Una lectura por modelo (nóminas, categorías, líneas, días trabajados) en
+        lugar de recorrer ``line_ids`` y ``worked_days_line_ids`` por nómina.
+
+        :returns: lista ordenada como la búsqueda de nóminas, de dicts con
+            ``employee``, ``worked_days`` (``[(nombre, días)]``), ``incomes`` y
+            ``deductions`` (``[(nombre, total)]``).
+        """
+        # Buscar todas las nóminas asociadas al Lote
+        payslips = self.env['hr.payslip'].search_read(
+            [('payslip_run_id', '=', self.payslip_run_id.id)], ['employee_id'])
+        receipts = {
+            payslip['id']: {
+                'employee': payslip['employee_id'][1] if payslip['employee_id'] else '',
+                'worked_days': [],
+                'incomes': [],
+                'deductions': [],
+            }
+            for payslip in payslips
+        }
+
+        # Categorías de ingresos ('ALW', 'ING') y deducciones ('DED')
+        categories = {
+            category['id']: 'deductions' if category['code'] == 'DED' else 'incomes'
+            for category in self.env['hr.salary.rule.category'].search_read(
+                [('code', 'in', INCOME_CATEGORIES + DEDUCTION_CATEGORIES)], ['code'])
+        }
+
+        # Líneas en el mismo orden que line_ids
+        for line in self.env['hr.payslip.line'].search_read(
+                [('slip_id', 'in', list(receipts)), ('category_id', 'in', list(categories))],
+                ['slip_id', 'category_id', 'name', 'total']):
+            receipts[line['slip_id'][0]][categories[line['category_id'][0]]].append(
+                (line['name'], line['total']))
+
+        for worked_day in self.env['hr.payslip.worked_days'].search_read(
+                [('payslip_id', 'in', list(receipts))],
+                ['payslip_id', 'name', 'number_of_days']):
+            receipts[worked_day['payslip_id'][0]]['worked_days'].append(
+                (worked_day['name'], worked_day['number_of_days']))
+
+        return list(receipts.values())
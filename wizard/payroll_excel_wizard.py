@@ -4,7 +4,28 @@ from odoo import models, fields, api
 import xlsxwriter
 import base64
 from io import BytesIO
+import csv
 import re
+import tempfile
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Columnas fijas de la exportación CSV/Parquet, antes de los códigos de regla
+MATRIX_KEY_COLUMNS = ('slip_id', 'employee_code', 'employee')
+
+# Filas por lote de registros escrito en la exportación Parquet
+PARQUET_BATCH_SIZE = 10000
+
+
+# Función para sanitizar el nombre del archivo
+def sanitize_filename(name):
+    return re.sub(r'[\\/*?:"<>|]', '_', name)
 
 
 class PayrollExcelWizard(models.TransientModel):
@@ -20,15 +41,61 @@ class PayrollExcelWizard(models.TransientModel):
     excel_file = fields.Binary('Archivo Excel', readonly=True)
     excel_file_name = fields.Char('Nombre del Archivo', readonly=True,
                                   default='Planilla.xlsx')
+    stream_export = fields.Boolean(
+        'Modo para lotes grandes',
+        help='Escribe el Excel fila por fila a un archivo temporal (constant_memory) '
+             'y lo guarda como adjunto del lote, sin mantenerlo entero en memoria.')
+    export_format = fields.Selection([
+        ('xlsx', 'Excel (Planilla)'),
+        ('csv', 'CSV'),
+        ('parquet', 'Parquet'),
+    ], string='Formato', default='xlsx', required=True,
+        help='CSV y Parquet exportan la misma matriz nómina × regla sin formato, '
+             'para bancos e integraciones.')
 
     def action_generate_excel(self):
         """
         Método que genera el archivo Excel con los datos de la nómina
         según el formato solicitado, incluyendo encabezados agrupados para ingresos y deducciones.
         """
+        if self.export_format != 'xlsx':
+            return self._export_matrix()
+
+        file_name = "{}.xlsx".format(sanitize_filename(self.payslip_run_id.name))
+        if self.stream_export:
+            with tempfile.NamedTemporaryFile(suffix='.xlsx') as tmp:
+                workbook = xlsxwriter.Workbook(tmp.name, {'constant_memory': True})
+                self._write_workbook(workbook)
+                workbook.close()
+                return self._store_export(tmp.name, file_name, XLSX_MIMETYPE)
+
         # Preparar el buffer en memoria
         output = BytesIO()
         workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+        self._write_workbook(workbook)
+
+        # Cerrar el workbook y obtener los bytes
+        workbook.close()
+        file_data = output.getvalue()
+        output.close()
+
+        self.excel_file = base64.b64encode(file_data)
+        self.excel_file_name = file_name
+
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'payroll.excel.wizard',
+            'view_mode': 'form',
+            'res_id': self.id,
+            'target': 'new',
+        }
+
+    def _write_workbook(self, workbook):
+        """Escribir la planilla del lote en ``workbook``.
+
+        Las filas se escriben en orden creciente, como exige el modo
+        ``constant_memory`` de xlsxwriter.
+        """
         worksheet = workbook.add_worksheet('Planilla')
 
         # Formatos de celda
@@ -74,24 +141,15 @@ class PayrollExcelWizard(models.TransientModel):
         # ------------------------------------------------------------
         # 3) ENCABEZADOS DE LAS REGLAS (AGRUPADO POR INGRESOS Y DEDUCCIONES)
         # ------------------------------------------------------------
-        # Obtenemos todas las reglas utilizadas en el lote.
-        all_rules = self.env['hr.salary.rule']
-        for slip in self.payslip_run_id.slip_ids:
-            for line in slip.line_ids:
-                if line.salary_rule_id not in all_rules:
-                    all_rules |= line.salary_rule_id
-
-        # Ordenamos las reglas (puedes ajustar el criterio de ordenación).
-        all_rules = all_rules.sorted(lambda r: r.id)
-
-        # Separamos las reglas en dos grupos:
-        income_rules = all_rules.filtered(lambda r: r.code and r.code.startswith('ING'))
-        deduction_rules = all_rules.filtered(
-            lambda r: not (r.code and r.code.startswith('ING')))
+        # Reglas usadas en el lote y montos por (nómina, regla) en una sola consulta
+        slips, income_rules, deduction_rules, matrix = self._get_rule_matrix()
 
         # Creamos una lista con el orden deseado: ingresos primero y luego deducciones.
         ordered_rules = income_rules + deduction_rules
 
+        # Columnas de la regla 'ING001' (Sueldo Ordinario)
+        base_columns = [idx for idx, rule in enumerate(ordered_rules) if rule.code == 'ING001']
+
         # La posición inicial de las columnas de las reglas es la columna 6 (columna G).
         col_start_rules = 6
 
@@ -136,7 +194,7 @@ class PayrollExcelWizard(models.TransientModel):
         current_row = data_start_row
         line_number = 1
 
-        for slip in self.payslip_run_id.slip_ids:
+        for slip, amounts in zip(slips, matrix):
             # Columna A: correlativo
             worksheet.write(current_row, 0, line_number, center_format)
             # Columna B: nombre del empleado
@@ -149,9 +207,8 @@ class PayrollExcelWizard(models.TransientModel):
             worksheet.write(current_row, 3, monthly_wage, currency_format)
 
             # Columna E: Sueldo Ordinario, obtenido de la regla con código 'ING001'
-            base_rule = slip.line_ids.filtered(
-                lambda ln: ln.salary_rule_id.code == 'ING001')
-            base_salary = base_rule.total if base_rule else monthly_wage
+            base_amounts = [amounts[idx] for idx in base_columns if amounts[idx] is not None]
+            base_salary = sum(base_amounts) if base_amounts else monthly_wage
             worksheet.write(current_row, 4, base_salary, currency_format)
 
             # Columna F: Sueldo Diario (mensual / 30)
@@ -159,12 +216,8 @@ class PayrollExcelWizard(models.TransientModel):
             worksheet.write(current_row, 5, daily_wage, currency_format)
 
             # Escribir los montos para cada regla en el orden de ordered_rules
-            for idx, rule in enumerate(ordered_rules):
-                line_rule = slip.line_ids.filtered(
-                    lambda ln: ln.salary_rule_id.id == rule.id)
-                amount = line_rule.total if line_rule else 0.0
-                worksheet.write(current_row, col_start_rules + idx, amount,
-                                currency_format)
+            worksheet.write_row(current_row, col_start_rules,
+                                [amount or 0.0 for amount in amounts], currency_format)
 
             current_row += 1
             line_number += 1
@@ -178,23 +231,125 @@ class PayrollExcelWizard(models.TransientModel):
         worksheet.write(firma_row, firma_col, 'Revisada por:', bold_format)
         worksheet.write(firma_row, firma_col + 2, 'Autorizada por:', bold_format)
 
-        # Cerrar el workbook y obtener los bytes
-        workbook.close()
-        file_data = output.getvalue()
-        output.close()
-
-        # Función para sanitizar el nombre del archivo
-        def sanitize_filename(name):
-            return re.sub(r'[\\/*?:"<>|]', '_', name)
-
-        self.excel_file = base64.b64encode(file_data)
-        self.excel_file_name = "{}.xlsx".format(
-            sanitize_filename(self.payslip_run_id.name))
+    def _get_rule_matrix(self):
+        """Matriz nómina × regla del lote a partir de un solo ``_read_group``.
 
+        :returns: tupla ``(slips, income_rules, deduction_rules, matrix)``;
+            ``matrix[i][j]`` es la suma de ``total`` de la nómina ``slips[i]``
+            para la regla j (ingresos primero, luego deducciones), o ``None``
+            si la nómina no tiene líneas de esa regla.
+        """
+        slips = self.payslip_run_id.slip_ids
+        groups = self.env['hr.payslip.line']._read_group(
+            [('slip_id', 'in', slips.ids)],
+            ['slip_id', 'salary_rule_id'],
+            ['total:sum'],
+        )
+
+        income_rules, deduction_rules = self._split_rules(
+            {rule.id for _slip, rule, _total in groups})
+
+        rule_index = {rule.id: idx for idx, rule in enumerate(income_rules + deduction_rules)}
+        slip_index = {slip_id: idx for idx, slip_id in enumerate(slips.ids)}
+        matrix = [[None] * len(rule_index) for _slip in slips]
+        for slip, rule, total in groups:
+            matrix[slip_index[slip.id]][rule_index[rule.id]] = total
+        return slips, income_rules, deduction_rules, matrix
+
+    def _split_rules(self, rule_ids):
+        """Reglas ordenadas por id y separadas en ingresos ('ING...') y deducciones."""
+        all_rules = self.env['hr.salary.rule'].browse(sorted(rule_ids))
+        all_rules.fetch(['name', 'code'])
+        income_rules = all_rules.filtered(lambda r: r.code and r.code.startswith('ING'))
+        return income_rules, all_rules - income_rules
+
+    def _store_export(self, path, file_name, mimetype):
+        """Guardar el archivo como adjunto del lote y devolver su descarga."""
+        attachment = self.env['ir.attachment']._create_from_path(path, {
+            'name': file_name,
+            'res_model': 'hr.payslip.run',
+            'res_id': self.payslip_run_id.id,
+            'mimetype': mimetype,
+        })
         return {
-            'type': 'ir.actions.act_window',
-            'res_model': 'payroll.excel.wizard',
-            'view_mode': 'form',
-            'res_id': self.id,
-            'target': 'new',
+            'type': 'ir.actions.act_url',
+            'url': f'/web/content/{attachment.id}?download=true',
+            'target': 'self',
         }
+
+    def _export_matrix(self):
+        """Exportar la matriz nómina × regla del lote en CSV o Parquet."""
+        if self.export_format == 'parquet':
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise UserError("La exportación Parquet requiere la librería de Python 'pyarrow'.")
+
+        rule_ids = [rule.id for rule, in self.env['hr.payslip.line']._read_group(
+            [('slip_id.payslip_run_id', '=', self.payslip_run_id.id)], ['salary_rule_id'])]
+        income_rules, deduction_rules = self._split_rules(rule_ids)
+        rules = income_rules + deduction_rules
+        header = MATRIX_KEY_COLUMNS + self._matrix_rule_columns(rules)
+        rows = self._iter_matrix_rows(rules.ids)
+
+        file_name = "{}.{}".format(sanitize_filename(self.payslip_run_id.name),
+                                   self.export_format)
+        with tempfile.NamedTemporaryFile(suffix='.' + self.export_format) as tmp:
+            if self.export_format == 'csv':
+                with open(tmp.name, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(header)
+                    writer.writerows(rows)
+                mimetype = 'text/csv'
+            else:
+                schema = pyarrow.schema(
+                    [(header[0], pyarrow.int64()), (header[1], pyarrow.string()),
+                     (header[2], pyarrow.string())]
+                    + [(name, pyarrow.float64()) for name in header[len(MATRIX_KEY_COLUMNS):]])
+                # por lotes de PARQUET_BATCH_SIZE filas, sin armar la matriz entera
+                with pyarrow.parquet.ParquetWriter(tmp.name, schema) as writer:
+                    for batch in split_every(PARQUET_BATCH_SIZE, rows, list):
+                        writer.write_batch(pyarrow.record_batch(
+                            [pyarrow.array(column, type=field.type)
+                             for column, field in zip(zip(*batch), schema)],
+                            schema=schema))
+                mimetype = 'application/vnd.apache.parquet'
+            return self._store_export(tmp.name, file_name, mimetype)
+
+    def _matrix_rule_columns(self, rules):
+        """Nombres de columna únicos de las reglas: el código, o ``código_id``
+        si el código se repite, está vacío o coincide con una columna fija."""
+        counts = Counter(rules.mapped('code'))
+        counts.update(MATRIX_KEY_COLUMNS)
+        return tuple(
+            rule.code if rule.code and counts[rule.code] == 1
+            else f"{rule.code or 'regla'}_{rule.id}"
+            for rule in rules
+        )
+
+    def _iter_matrix_rows(self, rule_ids):
+        """Filas ``(slip_id, código de empleado, empleado, montos...)`` del lote.
+
+        Una sola consulta agrupada por nómina y regla, ordenada por nómina; las
+        filas se arman al recorrer el resultado. Los montos siguen el orden de
+        ``rule_ids`` (0.0 si la nómina no tiene esa regla).
+        """
+        rule_index = {rule_id: idx for idx, rule_id in enumerate(rule_ids)}
+        self.env['hr.payslip.line'].flush_model(['slip_id', 'salary_rule_id', 'total'])
+        self.env['hr.payslip'].flush_model(['payslip_run_id', 'employee_id'])
+        self.env.cr.execute("""
+            SELECT p.id, e.registration_number, e.name, l.salary_rule_id, SUM(l.total)
+              FROM hr_payslip p
+              JOIN hr_employee e ON e.id = p.employee_id
+              LEFT JOIN hr_payslip_line l ON l.slip_id = p.id
+             WHERE p.payslip_run_id = %s
+             GROUP BY p.id, e.registration_number, e.name, l.salary_rule_id
+             ORDER BY p.id
+        """, [self.payslip_run_id.id])
+        for (slip_id, code, name), group in groupby(self.env.cr.fetchall(), key=itemgetter(0, 1, 2)):
+            amounts = [0.0] * len(rule_index)
+            for *_key, rule_id, total in group:
+                if rule_id in rule_index:
+                    amounts[rule_index[rule_id]] = round(total or 0.0, 2)
+            yield (slip_id, code or '', name or '', *amounts)